@@ -0,0 +1,130 @@
+"""Todo store benchmarks.
+
+Run with `python benchmark.py`:
+
+- per-operation latency at growing sizes (should stay flat from 1k to 1M);
+- cold-start recovery of 1M todos from a snapshot plus a log tail;
+- write latency through the group-committed log, with and without a
+  snapshot compaction running in the background.
+"""
+import asyncio
+import json
+import random
+import shutil
+import tempfile
+import time
+import uuid
+
+from main import TodoStore
+from storage import OperationLog, compact
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+OPS = 1_000
+
+
+def fill(n: int) -> TodoStore:
+    store = TodoStore()
+    for i in range(n):
+        store.add(str(uuid.uuid4()), f"task {i}")
+    return store
+
+
+def per_op_ns(fn, ids) -> float:
+    start = time.perf_counter_ns()
+    for todo_id in ids:
+        fn(todo_id)
+    return (time.perf_counter_ns() - start) / len(ids)
+
+
+def bench_ops():
+    print(f"{'items':>10} {'toggle':>10} {'update':>10} {'delete':>10}  (ns/op)")
+    for n in SIZES:
+        store = fill(n)
+        ids = random.sample(list(store.items), OPS)
+        toggle = per_op_ns(store.toggle, ids)
+        update = per_op_ns(lambda todo_id: store.update(todo_id, "edited"), ids)
+        delete = per_op_ns(store.delete, ids)
+        print(f"{n:>10} {toggle:>10.0f} {update:>10.0f} {delete:>10.0f}")
+
+
+def write_log(directory: str, n: int):
+    with open(f"{directory}/log-00000000.jsonl", "w", encoding="utf-8") as f:
+        store = TodoStore(on_change=lambda todo_id, version, todo: f.write(
+            json.dumps(["p", version, todo_id, todo["task"], todo["completed"]]) + "\n"))
+        for i in range(n):
+            store.add(str(uuid.uuid4()), f"task {i}", i % 3 == 0)
+
+
+def bench_recovery(n: int = 1_000_000, tail: int = 10_000):
+    directory = tempfile.mkdtemp()
+    try:
+        write_log(directory, n)
+        compact(directory, 1)
+        with open(f"{directory}/log-00000001.jsonl", "w", encoding="utf-8") as f:
+            for i in range(tail):
+                f.write(f'["p",{n + i + 1},"{uuid.uuid4()}","tail {i}",false]\n')
+
+        start = time.perf_counter()
+        store = TodoStore()
+        version, snapshot, records = OperationLog(directory).recover()
+        store.load(version, snapshot["ids"], snapshot["tasks"], snapshot["completed"])
+        for record in records:
+            store.put(record[2], record[3], record[4])
+        elapsed = time.perf_counter() - start
+        print(f"recovered {len(store)} todos ({tail} from the log tail) in {elapsed:.3f}s")
+    finally:
+        shutil.rmtree(directory)
+
+
+async def timed_writes(log: OperationLog, store: TodoStore, writers: int, per_writer: int) -> list:
+    latencies = []
+
+    async def writer():
+        for _ in range(per_writer):
+            start = time.perf_counter()
+            store.add(str(uuid.uuid4()), "task")
+            await log.sync()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(writer() for _ in range(writers)))
+    return sorted(latencies)
+
+
+async def bench_writes(n: int = 200_000, writers: int = 64, per_writer: int = 100):
+    directory = tempfile.mkdtemp()
+    try:
+        write_log(directory, n)
+        log = OperationLog(directory, segment_records=10 ** 9)
+        version, snapshot, records = log.recover()
+        store = TodoStore()
+        store.load(version, snapshot["ids"], snapshot["tasks"], snapshot["completed"])
+        for record in records:
+            store.put(record[2], record[3], record[4])
+        store.on_change = lambda todo_id, version, todo: log.record(
+            ["p", version, todo_id, todo["task"], todo["completed"]])
+        await log.start()
+
+        for label in ("idle", "during snapshot"):
+            if label == "during snapshot":
+                log.segment_records = 0
+                await timed_writes(log, store, 1, 1)
+                log.segment_records = 10 ** 9
+            commits = log.commits
+            latencies = await timed_writes(log, store, writers, per_writer)
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000
+            print(f"writes {label:>15}: p50 {p50:.2f} ms, p99 {p99:.2f} ms, "
+                  f"{len(latencies) / (log.commits - commits):.1f} writes/fsync")
+        await log.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    bench_ops()
+    bench_recovery()
+    asyncio.run(bench_writes())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,30 @@
+import os
 import uuid
-from fastapi import FastAPI, HTTPException, Response
+from bisect import bisect_right
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List
+from typing import Callable, Dict, List, Literal, Optional, Set, Union
+from storage import OperationLog
 
-app = FastAPI()
+DATA_DIR = os.getenv("TODO_DATA_DIR", "data")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    version, snapshot, records = todo_log.recover()
+    fake_todo_db.load(version, snapshot["ids"], snapshot["tasks"], snapshot["completed"])
+    for record in records:
+        if record[0] == "p":
+            fake_todo_db.put(record[2], record[3], record[4])
+        else:
+            fake_todo_db.delete(record[2])
+    fake_todo_db.on_change = log_change
+    await todo_log.start()
+    yield
+    await todo_log.close()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -31,52 +51,276 @@ class TodoCreate(BaseModel):
 class TodoUpdate(BaseModel):
     task: str
 
-fake_todo_db: List[TodoItem] = []
+class TodoBatchOp(BaseModel):
+    op: Literal["toggle", "update", "delete"]
+    id: str
+    task: Optional[str] = None
+
+class TodoBatchResult(BaseModel):
+    id: str
+    op: str
+    ok: bool
+    item: Optional[TodoItem] = None
+    error: Optional[str] = None
+
+class TodoPage(BaseModel):
+    items: List[TodoItem]
+    next_cursor: Optional[str] = None
+    version: int
+
+class TodoDelta(BaseModel):
+    version: int
+    items: List[TodoItem]
+    deleted: List[str]
+    reset: bool = False
+
+class TodoStore:
+    """Todos keyed by id; dict order is insertion order.
+
+    Only `id -> task` and the set of completed ids are kept, so a million
+    todos cost two containers rather than a million models. Reads return
+    plain dicts shaped like `TodoItem`.
+
+    Every mutation bumps `version`. `changes` maps id -> version of its last
+    change (oldest first) and doubles as the delta log; deleted ids stay in
+    it as tombstones until they are trimmed.
+    """
+
+    def __init__(self, on_change: Optional[Callable[[str, int, Optional[dict]], None]] = None):
+        self.on_change = on_change
+        self.items: Dict[str, str] = {}
+        self.completed_ids: Set[str] = set()
+        self.version = 0
+        self.changes: Dict[str, int] = {}
+        self.delta_floor = 0
+        self.order_seqs: List[int] = []
+        self.order_ids: List[str] = []
+        self.next_seq = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        completed = self.completed_ids
+        return ({"id": i, "task": t, "completed": i in completed} for i, t in self.items.items())
+
+    def get(self, todo_id: str) -> Optional[dict]:
+        task = self.items.get(todo_id)
+        if task is None:
+            return None
+        return {"id": todo_id, "task": task, "completed": todo_id in self.completed_ids}
+
+    def _touch(self, todo_id: str) -> Optional[dict]:
+        self.version += 1
+        self.changes.pop(todo_id, None)
+        self.changes[todo_id] = self.version
+        todo = self.get(todo_id)
+        if self.on_change is not None:
+            self.on_change(todo_id, self.version, todo)
+        return todo
+
+    def load(self, version: int, ids: List[str], tasks: List[str], completed: str):
+        # Bulk path for snapshot recovery; `completed` is a "0"/"1" string
+        # aligned with `ids`.
+        self.items = dict(zip(ids, tasks))
+        self.completed_ids = {i for i, flag in zip(ids, completed) if flag == "1"}
+        self.order_ids = ids
+        self.order_seqs = list(range(1, len(ids) + 1))
+        self.next_seq = len(ids)
+        self.changes = {}
+        self.version = self.delta_floor = version
+
+    def add(self, todo_id: str, task: str, completed: bool = False) -> dict:
+        self.items[todo_id] = task
+        if completed:
+            self.completed_ids.add(todo_id)
+        self.next_seq += 1
+        self.order_seqs.append(self.next_seq)
+        self.order_ids.append(todo_id)
+        return self._touch(todo_id)
+
+    def put(self, todo_id: str, task: str, completed: bool) -> dict:
+        if todo_id not in self.items:
+            return self.add(todo_id, task, completed)
+        self.items[todo_id] = task
+        if completed:
+            self.completed_ids.add(todo_id)
+        else:
+            self.completed_ids.discard(todo_id)
+        return self._touch(todo_id)
+
+    def toggle(self, todo_id: str) -> Optional[dict]:
+        if todo_id not in self.items:
+            return None
+        if todo_id in self.completed_ids:
+            self.completed_ids.discard(todo_id)
+        else:
+            self.completed_ids.add(todo_id)
+        return self._touch(todo_id)
 
-@app.get("/api/todos", response_model=List[TodoItem])
-async def get_all_todos():
-    return fake_todo_db
+    def update(self, todo_id: str, task: str) -> Optional[dict]:
+        if todo_id not in self.items:
+            return None
+        self.items[todo_id] = task
+        return self._touch(todo_id)
+
+    def delete(self, todo_id: str) -> Optional[dict]:
+        todo = self.get(todo_id)
+        if todo is not None:
+            del self.items[todo_id]
+            self.completed_ids.discard(todo_id)
+            self._touch(todo_id)
+            self._maybe_compact()
+        return todo
+
+    def delete_completed(self) -> int:
+        # Touches only the completed todos, not the whole store.
+        removed = len(self.completed_ids)
+        completed_ids, self.completed_ids = self.completed_ids, set()
+        for todo_id in completed_ids:
+            del self.items[todo_id]
+            self._touch(todo_id)
+        self._maybe_compact()
+        return removed
+
+    def _maybe_compact(self):
+        # Deleted ids linger in the order lists and as delta tombstones; drop
+        # them once they outnumber the live items. Seqs are kept, so cursors
+        # handed out earlier stay valid.
+        if len(self.order_ids) > 2 * len(self.items) + 1024:
+            live = [(seq, i) for seq, i in zip(self.order_seqs, self.order_ids) if i in self.items]
+            self.order_seqs = [seq for seq, _ in live]
+            self.order_ids = [i for _, i in live]
+        tombstones = len(self.changes) - len(self.items)
+        if tombstones > len(self.items) + 1024:
+            for todo_id, version in list(self.changes.items()):
+                if tombstones <= len(self.items):
+                    break
+                if todo_id not in self.items:
+                    del self.changes[todo_id]
+                    self.delta_floor = version
+                    tombstones -= 1
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version}"'
+
+    def page(self, cursor: int, limit: int) -> TodoPage:
+        items = []
+        i = bisect_right(self.order_seqs, cursor)
+        while i < len(self.order_ids) and len(items) < limit:
+            todo = self.get(self.order_ids[i])
+            if todo is not None:
+                items.append(todo)
+            i += 1
+        next_cursor = None
+        if items and i < len(self.order_ids):
+            # The last item shown came from position i - 1.
+            next_cursor = str(self.order_seqs[i - 1])
+        return TodoPage(items=items, next_cursor=next_cursor, version=self.version)
+
+    def delta(self, since: int) -> TodoDelta:
+        if since < self.delta_floor or since > self.version:
+            return TodoDelta(version=self.version, items=list(self), deleted=[], reset=True)
+        items, deleted = [], []
+        for todo_id, version in reversed(self.changes.items()):
+            if version <= since:
+                break
+            todo = self.get(todo_id)
+            if todo is None:
+                deleted.append(todo_id)
+            else:
+                items.append(todo)
+        items.reverse()
+        deleted.reverse()
+        return TodoDelta(version=self.version, items=items, deleted=deleted)
+
+fake_todo_db = TodoStore()
+todo_log = OperationLog(DATA_DIR)
+
+def log_change(todo_id: str, version: int, todo: Optional[dict]):
+    if todo is None:
+        todo_log.record(["d", version, todo_id])
+    else:
+        todo_log.record(["p", version, todo_id, todo["task"], todo["completed"]])
+
+@app.get("/api/todos", response_model=Union[List[TodoItem], TodoPage, TodoDelta])
+async def get_all_todos(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    since: Optional[int] = Query(None, ge=0),
+):
+    etag = fake_todo_db.etag
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    if since is not None:
+        return fake_todo_db.delta(since)
+    if cursor is not None or limit is not None:
+        try:
+            after = int(cursor) if cursor else 0
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return fake_todo_db.page(after, limit or 100)
+    return list(fake_todo_db)
 
 @app.post("/api/todos", response_model=TodoItem, status_code=201)
 async def create_todo(todo_data: TodoCreate):
-    new_todo = TodoItem(
-        id=str(uuid.uuid4()),
-        task=todo_data.task,
-        completed=False
-    )
-    fake_todo_db.append(new_todo)
+    new_todo = fake_todo_db.add(str(uuid.uuid4()), todo_data.task)
+    await todo_log.sync()
     return new_todo
 
+@app.post("/api/todos/batch", response_model=List[TodoBatchResult])
+async def batch_todos(ops: List[TodoBatchOp]):
+    results = []
+    for op in ops:
+        if op.op == "update" and op.task is None:
+            results.append(TodoBatchResult(id=op.id, op=op.op, ok=False, error="Task is required"))
+            continue
+        if op.op == "toggle":
+            todo = fake_todo_db.toggle(op.id)
+        elif op.op == "update":
+            todo = fake_todo_db.update(op.id, op.task)
+        else:
+            todo = fake_todo_db.delete(op.id)
+        if todo is None:
+            results.append(TodoBatchResult(id=op.id, op=op.op, ok=False, error="Todo not found"))
+        else:
+            item = None if op.op == "delete" else todo
+            results.append(TodoBatchResult(id=op.id, op=op.op, ok=True, item=item))
+    await todo_log.sync()
+    return results
+
+@app.delete("/api/todos/completed", status_code=204)
+async def delete_completed_todos():
+    fake_todo_db.delete_completed()
+    await todo_log.sync()
+    return
+
 @app.patch("/api/todos/{todo_id}", response_model=TodoItem)
 async def toggle_todo(todo_id: str):
-    for todo in fake_todo_db:
-        if todo.id == todo_id:
-            todo.completed = not todo.completed
-            return todo
-    raise HTTPException(status_code=404, detail="Todo not found")
+    todo = fake_todo_db.toggle(todo_id)
+    if todo is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    await todo_log.sync()
+    return todo
 
 @app.put("/api/todos/{todo_id}", response_model=TodoItem)
 async def update_todo(todo_id: str, updated_data: TodoUpdate):
-    for todo in fake_todo_db:
-        if todo.id == todo_id:
-            todo.task = updated_data.task
-            return todo
-    raise HTTPException(status_code=404, detail="Todo not found")
+    todo = fake_todo_db.update(todo_id, updated_data.task)
+    if todo is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    await todo_log.sync()
+    return todo
 
 @app.delete("/api/todos/{todo_id}", status_code=204)
 async def delete_todo(todo_id: str):
-    for todo in fake_todo_db:
-        if todo.id == todo_id:
-            fake_todo_db.remove(todo)
-            return
-    raise HTTPException(status_code=404, detail="Todo not found")
-
-@app.delete("/api/todos/completed", status_code=204)
-async def delete_completed_todos():
-    print("DELETE /api/todos/completed called", flush=True)
-    global fake_todo_db
-    fake_todo_db = [todo for todo in fake_todo_db if not (todo.completed if isinstance(todo, TodoItem) else todo.get("completed", False))]
-    return
+    if fake_todo_db.delete(todo_id) is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    await todo_log.sync()
 
 @app.get("/")
 async def root():
@@ -0,0 +1,231 @@
+"""Append-only operation log with group commit and snapshot compaction.
+
+The log is a series of segments `log-<gen>.jsonl`, one JSON array per line:
+
+    ["p", version, id, task, completed]   # todo created or changed
+    ["d", version, id]                    # todo deleted
+
+`snapshot-<gen>.json` holds the full state as of the start of segment
+`<gen>`, stored column-wise (`ids`, `tasks`, and `completed` as a "0"/"1"
+string) because parallel string lists load much faster than nested rows.
+Snapshots are built in a worker process from the previous snapshot plus the
+closed segments, so the live process never serializes its state.
+"""
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+SEGMENT_RECORDS = 100_000
+
+logger = logging.getLogger(__name__)
+
+
+def _gens(directory: str, prefix: str, suffix: str) -> List[int]:
+    gens = []
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(suffix):
+            try:
+                gens.append(int(name[len(prefix):-len(suffix)]))
+            except ValueError:
+                pass
+    return sorted(gens)
+
+
+def _segment_path(directory: str, gen: int) -> str:
+    return os.path.join(directory, f"log-{gen:08d}.jsonl")
+
+
+def _snapshot_path(directory: str, gen: int) -> str:
+    return os.path.join(directory, f"snapshot-{gen:08d}.json")
+
+
+def _encode(record: list) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def read_snapshot(directory: str) -> Tuple[int, int, dict]:
+    """Returns (gen, version, {"ids", "tasks", "completed"}) of the newest snapshot."""
+    gens = _gens(directory, "snapshot-", ".json")
+    if not gens:
+        return 0, 0, {"ids": [], "tasks": [], "completed": ""}
+    with open(_snapshot_path(directory, gens[-1]), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return gens[-1], data.pop("version"), data
+
+
+def read_segments(directory: str, from_gen: int, to_gen: Optional[int] = None) -> Iterator[list]:
+    for gen in _gens(directory, "log-", ".jsonl"):
+        if gen < from_gen or (to_gen is not None and gen >= to_gen):
+            continue
+        with open(_segment_path(directory, gen), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Torn write from a crash: nothing after it was acknowledged.
+                    break
+
+
+def compact(directory: str, upto_gen: int):
+    """Folds the newest snapshot and segments below `upto_gen` into a new snapshot."""
+    snap_gen, version, snapshot = read_snapshot(directory)
+    state = {i: (t, c == "1") for i, t, c in zip(snapshot["ids"], snapshot["tasks"], snapshot["completed"])}
+    del snapshot
+    for record in read_segments(directory, snap_gen, upto_gen):
+        version = record[1]
+        if record[0] == "p":
+            state[record[2]] = (record[3], record[4])
+        else:
+            state.pop(record[2], None)
+    data = {
+        "version": version,
+        "ids": list(state),
+        "tasks": [t for t, _ in state.values()],
+        "completed": "".join("1" if c else "0" for _, c in state.values()),
+    }
+
+    path = _snapshot_path(directory, upto_gen)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+    for gen in _gens(directory, "log-", ".jsonl"):
+        if gen < upto_gen:
+            os.remove(_segment_path(directory, gen))
+    for gen in _gens(directory, "snapshot-", ".json"):
+        if gen < upto_gen:
+            os.remove(_snapshot_path(directory, gen))
+
+
+class OperationLog:
+    """Buffers records and makes them durable in batches.
+
+    `record()` is synchronous and only queues the line; `await sync()` returns
+    once everything queued so far is written and fsynced. Requests that sync
+    while a commit is in flight share the next fsync.
+
+    A failed write fails only the requests waiting on it; the segment is
+    cut back to its last durable size before the next one.
+    """
+
+    def __init__(self, directory: str, segment_records: int = SEGMENT_RECORDS):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.gen = 0
+        self.commits = 0
+        self._file = None
+        # Bytes of the current segment known to be durable.
+        self._size = 0
+        self._records = 0
+        self._pending: List[str] = []
+        self._waiters: List[asyncio.Future] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._compaction: Optional[asyncio.Future] = None
+
+    def recover(self) -> Tuple[int, dict, Iterator[list]]:
+        """Returns (version, snapshot columns, log records after the snapshot)."""
+        os.makedirs(self.directory, exist_ok=True)
+        snap_gen, version, snapshot = read_snapshot(self.directory)
+        segments = _gens(self.directory, "log-", ".jsonl")
+        self.gen = max(segments[-1] + 1 if segments else 0, snap_gen)
+        return version, snapshot, read_segments(self.directory, snap_gen)
+
+    async def start(self):
+        # Always start a fresh segment so a torn tail is never appended to.
+        self._file = open(_segment_path(self.directory, self.gen), "ab")
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._wake = asyncio.Event()
+        self._writer = asyncio.create_task(self._run())
+
+    async def close(self):
+        await self.sync()
+        if self._writer:
+            self._writer.cancel()
+        if self._compaction:
+            await asyncio.shield(self._compaction)
+        if self._pool:
+            self._pool.shutdown()
+        if self._file:
+            self._file.close()
+
+    def record(self, record: list):
+        self._pending.append(_encode(record))
+
+    async def sync(self):
+        if not self._pending or self._writer is None:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._wake.set()
+        await waiter
+
+    def _write(self, data: bytes):
+        try:
+            if self._file is None:
+                self._file = open(_segment_path(self.directory, self.gen), "ab")
+                # Drop whatever a failed write left past the durable end, so
+                # later records never follow a torn line.
+                self._file.truncate(self._size)
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except BaseException:
+            self._discard()
+            raise
+        self._size += len(data)
+
+    def _discard(self):
+        file, self._file = self._file, None
+        if file is not None:
+            try:
+                file.close()
+            except OSError:
+                pass
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            lines, waiters = self._pending, self._waiters
+            self._pending, self._waiters = [], []
+            if not lines:
+                continue
+            try:
+                await asyncio.to_thread(self._write, "".join(lines).encode("utf-8"))
+            except Exception as e:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+            self.commits += 1
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+            self._records += len(lines)
+            if self._records >= self.segment_records and self._compaction is None:
+                self._rotate()
+
+    def _rotate(self):
+        # The new segment is created by its first write.
+        self._discard()
+        self.gen += 1
+        self._records = 0
+        self._size = 0
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=1)
+        loop = asyncio.get_running_loop()
+        self._compaction = loop.run_in_executor(self._pool, compact, self.directory, self.gen)
+        self._compaction.add_done_callback(self._compaction_done)
+
+    def _compaction_done(self, future: asyncio.Future):
+        self._compaction = None
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Snapshot compaction failed", exc_info=future.exception())
@@ -1,7 +1,17 @@
-from fastapi import FastAPI, HTTPException
+import gzip
+import hashlib
+import json
+import markdown
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Literal, Optional, Union
+from search import SearchIndex
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = FastAPI()
 
@@ -28,6 +38,16 @@ class PostBase(BaseModel):
 class PostFull(PostBase):
     content: str
 
+class PostRendered(PostFull):
+    content_html: str
+
+class SearchHit(PostBase):
+    score: float
+
+class SearchResults(BaseModel):
+    total: int
+    items: List[SearchHit]
+
 fake_posts_db: List[PostFull] = [
     PostFull(
         slug="first-post",
@@ -55,16 +75,117 @@ fake_posts_db: List[PostFull] = [
     )
 ]
 
+posts_by_slug: Dict[str, PostFull] = {}
+
+# Rendered HTML keyed by the sha256 of the Markdown source, so a post is
+# rendered once and re-rendered only when its content actually changes.
+html_cache: Dict[str, str] = {}
+content_hash_by_slug: Dict[str, str] = {}
+content_hash_refs: Dict[str, int] = {}
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+search_index = SearchIndex()
+
+class CachedResponse:
+    """A JSON body serialized once, with compressed variants and an ETag."""
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.encoded = {"gzip": gzip.compress(self.body, compresslevel=9)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(self.body, quality=9)
+
+# "posts" for the listing, "post:<slug>:<format>" for single posts. Entries
+# are built on first request and dropped whenever a post they cover changes.
+response_cache: Dict[str, CachedResponse] = {}
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    encodings = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+def serve_cached(request: Request, cached: CachedResponse) -> Response:
+    headers = {"ETag": cached.etag, "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == cached.etag:
+        return Response(status_code=304, headers=headers)
+    accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+    for encoding in ("br", "gzip"):
+        if accepted.get(encoding, 0) > 0 and encoding in cached.encoded:
+            headers["Content-Encoding"] = encoding
+            return Response(cached.encoded[encoding], media_type="application/json", headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
+
+def index_post(post: PostFull):
+    posts_by_slug[post.slug] = post
+    response_cache.pop("posts", None)
+    response_cache.pop(f"post:{post.slug}:markdown", None)
+    response_cache.pop(f"post:{post.slug}:html", None)
+    search_index.add(post.slug, post.dict())
+    new_hash = content_hash(post.content)
+    old_hash = content_hash_by_slug.get(post.slug)
+    if old_hash == new_hash:
+        return
+    content_hash_by_slug[post.slug] = new_hash
+    content_hash_refs[new_hash] = content_hash_refs.get(new_hash, 0) + 1
+    if old_hash is not None:
+        content_hash_refs[old_hash] -= 1
+        if not content_hash_refs[old_hash]:
+            del content_hash_refs[old_hash]
+            html_cache.pop(old_hash, None)
+
+def render_html(post: PostFull) -> str:
+    key = content_hash_by_slug[post.slug]
+    html = html_cache.get(key)
+    if html is None:
+        html = markdown.markdown(post.content)
+        html_cache[key] = html
+    return html
+
+for post in fake_posts_db:
+    index_post(post)
+
 @app.get("/api/posts", response_model=List[PostBase])
-async def get_all_posts():
-    return fake_posts_db
-
-@app.get("/api/posts/{slug}", response_model=PostFull)
-async def get_post_by_slug(slug: str):
-    for post in fake_posts_db:
-        if post.slug == slug:
-            return post
-    raise HTTPException(status_code=404, detail="Post not found")
+async def get_all_posts(request: Request):
+    cached = response_cache.get("posts")
+    if cached is None:
+        cached = response_cache["posts"] = CachedResponse([post.dict(exclude={"content"}) for post in fake_posts_db])
+    return serve_cached(request, cached)
+
+@app.get("/api/posts/search", response_model=SearchResults)
+async def search_posts(
+    q: str = Query(..., min_length=1),
+    category: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+):
+    total, hits = search_index.search(q, category, (page - 1) * limit, limit)
+    items = [SearchHit(**posts_by_slug[slug].dict(), score=score) for slug, score in hits]
+    return SearchResults(total=total, items=items)
+
+@app.get("/api/posts/{slug}", response_model=Union[PostRendered, PostFull])
+async def get_post_by_slug(request: Request, slug: str, format: Literal["markdown", "html"] = "markdown"):
+    key = f"post:{slug}:{format}"
+    cached = response_cache.get(key)
+    if cached is None:
+        post = posts_by_slug.get(slug)
+        if post is None:
+            raise HTTPException(status_code=404, detail="Post not found")
+        payload = post.dict()
+        if format == "html":
+            payload["content_html"] = render_html(post)
+        cached = response_cache[key] = CachedResponse(payload)
+    return serve_cached(request, cached)
 
 @app.get("/")
 async def root():
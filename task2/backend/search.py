@@ -0,0 +1,110 @@
+"""In-process full-text search over posts: inverted index + BM25.
+
+Tokens are case-folded words (Cyrillic or Latin) with light suffix
+stripping, so "постов"/"посты" and "posts"/"post" meet on one term. Fields
+are weighted (a title hit counts more than a content hit) by scaling term
+frequencies before BM25, as in BM25F.
+"""
+import heapq
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+CYRILLIC_RE = re.compile(r"[а-я]")
+
+FIELD_WEIGHTS = {"title": 3.0, "content": 1.0, "author": 2.0, "category": 1.0}
+
+# Longest first; a suffix is stripped only if at least MIN_STEM letters remain.
+RU_SUFFIXES = sorted({
+    "иями", "ями", "ами", "ией", "ий", "ый", "ой", "ей", "ая", "яя", "ое", "ее",
+    "ие", "ые", "ого", "его", "ому", "ему", "ыми", "ими", "ых", "их", "ую", "юю",
+    "ом", "ем", "ам", "ям", "ах", "ях", "ов", "ев", "ию", "ью", "ия", "ья", "ть",
+    "ться", "тся", "ешь", "ет", "ете", "ут", "ют", "ит", "ишь", "им", "ите",
+    "ат", "ят", "ал", "ала", "али", "ило", "ил", "ила", "или", "ел", "ела", "ели",
+    "ость", "ости", "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+}, key=len, reverse=True)
+EN_SUFFIXES = sorted({
+    "ingly", "edly", "ing", "ness", "ment", "ies", "ied", "ed", "es", "ly", "s",
+}, key=len, reverse=True)
+MIN_STEM = 3
+
+
+@lru_cache(maxsize=200_000)
+def stem(word: str) -> str:
+    suffixes = RU_SUFFIXES if CYRILLIC_RE.search(word) else EN_SUFFIXES
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(w) for w in WORD_RE.findall(text.casefold().replace("ё", "е"))]
+
+
+class SearchIndex:
+    """Inverted index that can add, replace and remove documents in place."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, float]] = {}
+        self.doc_terms: Dict[str, Dict[str, float]] = {}
+        self.doc_len: Dict[str, float] = {}
+        self.doc_category: Dict[str, str] = {}
+        self.total_len = 0.0
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, doc_id: str, fields: Dict[str, str]):
+        if doc_id in self.doc_len:
+            self.remove(doc_id)
+        terms: Dict[str, float] = {}
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(fields.get(field, "")):
+                terms[token] = terms.get(token, 0.0) + weight
+                length += weight
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.doc_terms[doc_id] = terms
+        self.doc_len[doc_id] = length
+        self.doc_category[doc_id] = fields.get("category", "").casefold()
+        self.total_len += length
+
+    def remove(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+        self.total_len -= self.doc_len.pop(doc_id)
+        del self.doc_category[doc_id]
+
+    def search(self, query: str, category: Optional[str] = None,
+               offset: int = 0, limit: int = 10) -> Tuple[int, List[Tuple[str, float]]]:
+        """Returns (total matches, [(doc_id, score), ...]) for one page."""
+        n = len(self.doc_len)
+        if not n:
+            return 0, []
+        avg_len = self.total_len / n
+        wanted = category.casefold() if category else None
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                if wanted is not None and self.doc_category[doc_id] != wanted:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return len(scores), top[offset:]
@@ -10,6 +10,7 @@ interface Post {
   slug: string;
   title: string;
   content: string;
+  content_html: string;
 }
 
 const API_URL = 'http://localhost:8000/api/posts';
@@ -25,7 +26,7 @@ export default function PostPage() {
     if (slug) {
       const fetchPost = async () => {
         try {
-          const response = await axios.get(`${API_URL}/${slug}`);
+          const response = await axios.get(`${API_URL}/${slug}`, { params: { format: 'html' } });
           setPost(response.data);
         } catch (error) {
           console.error(`Error fetching post ${slug}:`, error);
@@ -51,7 +52,7 @@ export default function PostPage() {
         <h1 className="text-4xl font-extrabold text-gray-900 mb-4">{post.title}</h1>
         <div
             className="prose lg:prose-xl text-gray-700"
-            dangerouslySetInnerHTML={{ __html: post.content.replace(/\n/g, '<br />') }}
+            dangerouslySetInnerHTML={{ __html: post.content_html }}
         />
     </article>
   );
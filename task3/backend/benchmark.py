@@ -0,0 +1,97 @@
+"""Upstream benchmarks against the local stand-in server.
+
+Run with `python benchmark.py`. It starts fake_upstream on 127.0.0.1:8099 and
+calls the app in-process through ASGI:
+
+- a new httpx client per request (the old behaviour) against the app's
+  shared pooled client, with every request for a distinct city;
+- a burst of concurrent requests for one hot city, counting how many
+  reach the upstream.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+PORT = 8099
+UPSTREAM = f"http://127.0.0.1:{PORT}"
+REQUESTS = 2000
+CONCURRENCY = 50
+HOT_REQUESTS = 1000
+
+os.environ.setdefault("OPENWEATHER_API_KEY", "test")
+os.environ["OPENWEATHER_BASE_URL"] = UPSTREAM
+
+
+def report(label: str, latencies: list, elapsed: float):
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{label:>22}: {len(latencies) / elapsed:7.0f} req/s, p50 {p50:6.1f} ms, p99 {p99:6.1f} ms")
+
+
+async def run(call) -> tuple:
+    latencies = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await call(f"city{i}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(REQUESTS)))
+    return latencies, time.perf_counter() - started
+
+
+async def client_per_request(city: str):
+    async with httpx.AsyncClient() as client:
+        response = await client.get(f"{UPSTREAM}/weather", params={"q": city, "appid": "test"})
+        response.raise_for_status()
+
+
+async def main():
+    report("client per request", *await run(client_per_request))
+
+    import main as weather_app
+    async with weather_app.app.router.lifespan_context(weather_app.app):
+        transport = httpx.ASGITransport(app=weather_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as app_client:
+            async def via_app(city: str):
+                response = await app_client.get(f"/api/weather/{city}")
+                response.raise_for_status()
+
+            report("shared pooled client", *await run(via_app))
+            metrics = (await app_client.get("/api/metrics/upstream")).json()
+            print(f"shared client opened {metrics['connections_opened']} connections "
+                  f"for {metrics['requests']} requests ({metrics['reused']} reused)")
+
+            before = metrics["requests"]
+            started = time.perf_counter()
+            await asyncio.gather(*(app_client.get("/api/weather/Almaty") for _ in range(HOT_REQUESTS)))
+            elapsed = time.perf_counter() - started
+            metrics = (await app_client.get("/api/metrics/upstream")).json()
+            cache = (await app_client.get("/api/metrics/cache")).json()
+            print(f"{HOT_REQUESTS} concurrent hot-city requests in {elapsed:.2f}s -> "
+                  f"{metrics['requests'] - before} upstream call(s), {cache['coalesced']} coalesced")
+
+
+if __name__ == "__main__":
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fake_upstream:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    try:
+        for _ in range(50):
+            try:
+                httpx.get(f"{UPSTREAM}/stats")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        asyncio.run(main())
+    finally:
+        server.terminate()
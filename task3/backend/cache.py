@@ -0,0 +1,94 @@
+"""Async TTL cache with LRU eviction, request coalescing and stale-while-revalidate."""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class AsyncTTLCache:
+    """Caches the results of async loaders.
+
+    - A fresh entry is returned as is.
+    - An entry expired less than `stale_ttl` seconds ago is returned at once
+      while one background task refreshes it.
+    - Concurrent misses for one key share a single in-flight load.
+    - Past `max_entries`, the least recently used entry is evicted.
+
+    Loader exceptions are not cached; they reach every caller waiting on
+    that load.
+    """
+
+    def __init__(self, max_entries: int = 10_000, stale_ttl: float = 600):
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "evictions": 0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def peek(self, key: Hashable) -> Any:
+        """Returns a fresh cached value without loading it, or None."""
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() >= entry[1]:
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[0]
+
+    async def get(self, key: Hashable, ttl: float, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            now = time.monotonic()
+            if now < expires_at:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+            if now < expires_at + self.stale_ttl:
+                self._entries.move_to_end(key)
+                self.stats["stale_hits"] += 1
+                if key not in self._inflight:
+                    self.stats["refreshes"] += 1
+                    task = self._start(key, ttl, loader)
+                    task.add_done_callback(self._refresh_done)
+                return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            task = self._start(key, ttl, loader)
+        # Shielded so one cancelled caller does not cancel the shared load.
+        return await asyncio.shield(task)
+
+    def _start(self, key: Hashable, ttl: float, loader: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = asyncio.ensure_future(self._load(key, ttl, loader))
+        self._inflight[key] = task
+        return task
+
+    async def _load(self, key: Hashable, ttl: float, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await loader()
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _refresh_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["refresh_errors"] += 1
@@ -0,0 +1,57 @@
+"""Local stand-in for the OpenWeather API, for offline benchmarks.
+
+    uvicorn fake_upstream:app --port 8099
+    OPENWEATHER_BASE_URL=http://127.0.0.1:8099 OPENWEATHER_API_KEY=test fastapi dev main.py
+
+FAKE_UPSTREAM_DELAY_MS adds a fixed server-side delay to every response.
+"""
+import asyncio
+import os
+import zlib
+from fastapi import FastAPI, HTTPException
+
+app = FastAPI()
+
+DELAY = float(os.getenv("FAKE_UPSTREAM_DELAY_MS", "20")) / 1000
+
+request_count = 0
+
+
+def fake_reading(key: str, offset: int = 0) -> dict:
+    seed = zlib.crc32(key.encode("utf-8")) + offset
+    return {
+        "main": {"temp": round(-10 + seed % 400 / 10, 1)},
+        "weather": [{"description": "ясно", "icon": "01d"}],
+    }
+
+
+@app.get("/weather")
+async def weather(q: str = None, lat: float = None, lon: float = None):
+    global request_count
+    request_count += 1
+    await asyncio.sleep(DELAY)
+    if q is not None and q.lower() == "nowhere":
+        raise HTTPException(status_code=404, detail="city not found")
+    if q is not None:
+        name = q
+        seed = zlib.crc32(q.encode("utf-8"))
+        lat, lon = seed % 1400 / 10 - 70, seed // 1400 % 3600 / 10 - 180
+    else:
+        name = f"{lat:.2f},{lon:.2f}"
+    return {"name": name, "coord": {"lat": lat, "lon": lon}, **fake_reading(name)}
+
+
+@app.get("/forecast")
+async def forecast(q: str):
+    global request_count
+    request_count += 1
+    await asyncio.sleep(DELAY)
+    items = []
+    for i in range(40):
+        items.append({"dt_txt": f"2025-01-{1 + i // 8:02d} {i % 8 * 3:02d}:00:00", **fake_reading(q, i)})
+    return {"list": items}
+
+
+@app.get("/stats")
+async def stats():
+    return {"requests": request_count}
@@ -0,0 +1,49 @@
+"""Geohash encoding used to snap coordinates to cache cells."""
+import math
+from typing import Tuple
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+KM_PER_DEGREE = 111.32
+
+
+def encode(lat: float, lon: float, precision: int) -> Tuple[str, float, float]:
+    """Returns (geohash, cell center lat, cell center lon)."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                value = value << 1 | 1
+                lon_lo = mid
+            else:
+                value <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = value << 1 | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars), (lat_lo + lat_hi) / 2, (lon_lo + lon_hi) / 2
+
+
+def cell_size_km(precision: int, lat: float = 0.0) -> Tuple[float, float]:
+    """Approximate (height, width) of a cell in km at the given latitude."""
+    lon_bits = (precision * 5 + 1) // 2
+    lat_bits = precision * 5 // 2
+    height = 180 / 2 ** lat_bits * KM_PER_DEGREE
+    width = 360 / 2 ** lon_bits * KM_PER_DEGREE * math.cos(math.radians(lat))
+    return height, width
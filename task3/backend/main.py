@@ -1,13 +1,85 @@
+import asyncio
+import json
 import os
+import time
 import httpx
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import List
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+from cache import AsyncTTLCache
+import geo
 
 load_dotenv()
 print("🔑 OPENWEATHER_API_KEY =", os.getenv("OPENWEATHER_API_KEY"))
 
-app = FastAPI()
+API_KEY = os.getenv("OPENWEATHER_API_KEY")
+BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "50"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "0") == "1"
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "10"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5"))
+
+CACHE_WEATHER_TTL = float(os.getenv("CACHE_WEATHER_TTL", "300"))
+CACHE_FORECAST_TTL = float(os.getenv("CACHE_FORECAST_TTL", "1800"))
+CACHE_STALE_TTL = float(os.getenv("CACHE_STALE_TTL", "600"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+# Geohash precision 5 is a ~4.9 x 4.9 km cell, 6 is ~1.2 x 0.6 km. Larger
+# cells trade accuracy for hit rate.
+COORDS_GEOHASH_PRECISION = int(os.getenv("COORDS_GEOHASH_PRECISION", "5"))
+COORDS_CITY_LOOKUP = os.getenv("COORDS_CITY_LOOKUP", "1") == "1"
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "10"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+http_client: httpx.AsyncClient = None
+weather_cache = AsyncTTLCache(max_entries=CACHE_MAX_ENTRIES, stale_ttl=CACHE_STALE_TTL)
+
+# geohash cell -> cache key of a city whose reported coordinates fall in it,
+# so a coordinate lookup can reuse a fresh city entry.
+city_cells = {}
+
+coords_stats = {"requests": 0, "city_hits": 0, "upstream": 0}
+
+upstream_stats = {
+    "requests": 0,
+    "errors": 0,
+    "waiting": 0,
+    "in_use": 0,
+    "connections_opened": 0,
+    "reused": 0,
+    "total_latency_ms": 0.0,
+}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client
+    http_client = httpx.AsyncClient(
+        base_url=BASE_URL,
+        http2=UPSTREAM_HTTP2,
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=UPSTREAM_CONNECT_TIMEOUT,
+            read=UPSTREAM_READ_TIMEOUT,
+            write=UPSTREAM_READ_TIMEOUT,
+            pool=UPSTREAM_POOL_TIMEOUT,
+        ),
+    )
+    yield
+    await http_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["http://localhost:3000"]
 app.add_middleware(
@@ -18,24 +90,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-API_KEY = os.getenv("OPENWEATHER_API_KEY")
-BASE_URL = "https://api.openweathermap.org/data/2.5"
+async def fetch_upstream(path: str, params: dict) -> httpx.Response:
+    """GET from OpenWeather through the shared pooled client.
 
-@app.get("/api/weather/{city}")
-async def get_weather(city: str):
-    if not API_KEY:
-        raise HTTPException(status_code=500, detail="API key is not configured")
+    A request counts as waiting until the pool hands it a connection, then
+    as in use until the response is read. It counts as reused if no new TCP
+    connection was opened for it.
+    """
+    state = {"waiting": True, "connected": False}
 
-    url = f"{BASE_URL}/weather"
-    params = {
-        "q": city,
-        "appid": API_KEY,
-        "units": "metric",
-        "lang": "ru"
-    }
+    def got_connection():
+        if state["waiting"]:
+            state["waiting"] = False
+            upstream_stats["waiting"] -= 1
+            upstream_stats["in_use"] += 1
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
+    async def trace(event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.started":
+            state["connected"] = True
+            upstream_stats["connections_opened"] += 1
+            got_connection()
+        elif event_name.endswith("send_request_headers.started"):
+            got_connection()
+
+    upstream_stats["requests"] += 1
+    upstream_stats["waiting"] += 1
+    started = time.perf_counter()
+    try:
+        return await http_client.get(path, params={**params, "appid": API_KEY}, extensions={"trace": trace})
+    except httpx.HTTPError as e:
+        upstream_stats["errors"] += 1
+        raise HTTPException(status_code=502, detail=f"Upstream error: {e.__class__.__name__}")
+    finally:
+        if state["waiting"]:
+            upstream_stats["waiting"] -= 1
+        else:
+            upstream_stats["in_use"] -= 1
+        if not state["connected"]:
+            upstream_stats["reused"] += 1
+        upstream_stats["total_latency_ms"] += (time.perf_counter() - started) * 1000
+
+async def load_weather(params: dict) -> dict:
+    response = await fetch_upstream("/weather", params)
 
     if response.status_code == 404:
         raise HTTPException(status_code=404, detail="City not found")
@@ -45,6 +141,14 @@ async def get_weather(city: str):
 
     data = response.json()
 
+    coord = data.get("coord")
+    if coord is not None:
+        cell = geo.encode(coord["lat"], coord["lon"], COORDS_GEOHASH_PRECISION)[0]
+        city_cells.pop(cell, None)
+        city_cells[cell] = cache_key("weather", params["q"], params)
+        if len(city_cells) > CACHE_MAX_ENTRIES:
+            del city_cells[next(iter(city_cells))]
+
     return {
         "city_name": data["name"],
         "temperature": data["main"]["temp"],
@@ -52,21 +156,8 @@ async def get_weather(city: str):
         "icon": data["weather"][0]["icon"]
     }
 
-@app.get("/api/forecast/{city}")
-async def get_forecast(city: str):
-    if not API_KEY:
-        raise HTTPException(status_code=500, detail="API key is not configured")
-
-    url = f"{BASE_URL}/forecast"
-    params = {
-        "q": city,
-        "appid": API_KEY,
-        "units": "metric",
-        "lang": "ru"
-    }
-
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
+async def load_forecast(params: dict) -> list:
+    response = await fetch_upstream("/forecast", params)
 
     if response.status_code != 200:
         error_detail = response.json().get("message", "Error fetching forecast")
@@ -87,22 +178,43 @@ async def get_forecast(city: str):
 
     return result
 
-@app.get("/api/weather/coords/")
-async def get_weather_by_coords(lat: float, lon: float):
+def normalize_city(city: str) -> str:
+    return " ".join(city.split()).casefold()
+
+def cache_key(endpoint: str, location, params: dict) -> tuple:
+    return (endpoint, location, params["units"], params["lang"])
+
+@app.get("/api/weather/{city}")
+async def get_weather(city: str):
+    if not API_KEY:
+        raise HTTPException(status_code=500, detail="API key is not configured")
+
+    city = normalize_city(city)
+    params = {
+        "q": city,
+        "units": "metric",
+        "lang": "ru"
+    }
+    key = cache_key("weather", city, params)
+    return await weather_cache.get(key, CACHE_WEATHER_TTL, lambda: load_weather(params))
+
+@app.get("/api/forecast/{city}")
+async def get_forecast(city: str):
     if not API_KEY:
         raise HTTPException(status_code=500, detail="API key is not configured")
 
-    url = f"{BASE_URL}/weather"
+    city = normalize_city(city)
     params = {
-        "lat": lat,
-        "lon": lon,
-        "appid": API_KEY,
+        "q": city,
         "units": "metric",
         "lang": "ru"
     }
+    key = cache_key("forecast", city, params)
+    return await weather_cache.get(key, CACHE_FORECAST_TTL, lambda: load_forecast(params))
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
+async def load_weather_by_coords(params: dict) -> dict:
+    coords_stats["upstream"] += 1
+    response = await fetch_upstream("/weather", params)
 
     if response.status_code != 200:
         error_detail = response.json().get("message", "Error fetching weather by coords")
@@ -117,6 +229,117 @@ async def get_weather_by_coords(lat: float, lon: float):
         "icon": data["weather"][0]["icon"]
     }
 
+@app.get("/api/weather/coords/")
+async def get_weather_by_coords(lat: float, lon: float):
+    if not API_KEY:
+        raise HTTPException(status_code=500, detail="API key is not configured")
+
+    # Raw client coordinates never repeat, so they are snapped to a geohash
+    # cell and the cell center is what gets fetched and cached.
+    cell, cell_lat, cell_lon = geo.encode(lat, lon, COORDS_GEOHASH_PRECISION)
+    params = {
+        "lat": round(cell_lat, 4),
+        "lon": round(cell_lon, 4),
+        "units": "metric",
+        "lang": "ru"
+    }
+    coords_stats["requests"] += 1
+
+    if COORDS_CITY_LOOKUP and cell in city_cells:
+        cached = weather_cache.peek(city_cells[cell])
+        if cached is not None:
+            coords_stats["city_hits"] += 1
+            return cached
+
+    key = cache_key("coords", cell, params)
+    return await weather_cache.get(key, CACHE_WEATHER_TTL, lambda: load_weather_by_coords(params))
+
+class Coords(BaseModel):
+    lat: float
+    lon: float
+
+class WeatherBatchRequest(BaseModel):
+    cities: List[str] = []
+    coords: List[Coords] = []
+
+async def batch_item(query, semaphore: asyncio.Semaphore) -> dict:
+    async with semaphore:
+        try:
+            if isinstance(query, str):
+                data = await get_weather(query)
+            else:
+                data = await get_weather_by_coords(query["lat"], query["lon"])
+            return {"query": query, "ok": True, "data": data}
+        except HTTPException as e:
+            return {"query": query, "ok": False, "error": {"status": e.status_code, "detail": e.detail}}
+        except Exception as e:
+            # A malformed upstream body (an HTML error page, a missing key)
+            # fails only this item.
+            error = {"status": 502, "detail": f"Upstream error: {e.__class__.__name__}"}
+            return {"query": query, "ok": False, "error": error}
+
+@app.post("/api/weather/batch")
+async def get_weather_batch(payload: WeatherBatchRequest, stream: bool = False):
+    """Weather for many cities/coordinates, fetched with bounded concurrency.
+
+    Repeated entries are fetched once. Failures are reported per item. With
+    `?stream=true` results are sent as NDJSON in completion order instead of
+    one JSON document in request order.
+    """
+    queries = {}
+    for city in payload.cities:
+        queries.setdefault(("city", normalize_city(city)), city.strip())
+    for c in payload.coords:
+        queries.setdefault(("coords", c.lat, c.lon), {"lat": c.lat, "lon": c.lon})
+    if len(queries) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} items per batch")
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    if not stream:
+        results = await asyncio.gather(*(batch_item(q, semaphore) for q in queries.values()))
+        return {"results": results}
+
+    async def ndjson():
+        tasks = [asyncio.ensure_future(batch_item(q, semaphore)) for q in queries.values()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.get("/api/metrics/upstream")
+async def get_upstream_metrics():
+    requests = upstream_stats["requests"]
+    return {
+        **upstream_stats,
+        "avg_latency_ms": upstream_stats["total_latency_ms"] / requests if requests else 0.0,
+        "max_connections": UPSTREAM_MAX_CONNECTIONS,
+        "max_keepalive_connections": UPSTREAM_MAX_KEEPALIVE,
+        "http2": UPSTREAM_HTTP2,
+    }
+
+@app.get("/api/metrics/cache")
+async def get_cache_metrics():
+    requests = coords_stats["requests"]
+    height_km, width_km = geo.cell_size_km(COORDS_GEOHASH_PRECISION)
+    return {
+        **weather_cache.stats,
+        "entries": len(weather_cache),
+        "max_entries": CACHE_MAX_ENTRIES,
+        "coords": {
+            **coords_stats,
+            "hit_rate": 1 - coords_stats["upstream"] / requests if requests else 0.0,
+            "geohash_precision": COORDS_GEOHASH_PRECISION,
+            "cell_height_km": round(height_km, 3),
+            "cell_width_km_at_equator": round(width_km, 3),
+            "known_city_cells": len(city_cells),
+        },
+    }
+
 @app.get("/")
 def root():
     return {"message": "FastAPI backend is running 🚀"}
@@ -0,0 +1,138 @@
+"""Shortener benchmarks.
+
+Run with `python benchmark.py [links]` (default 1,000,000).
+
+- Cold start and memory of the link table against loading every link into
+  a dict. Memory is read from /proc/self/status, so the numbers are
+  Linux-only. RssAnon is private heap memory; RssFile is page cache mapped
+  into the process, which every worker shares and the kernel can drop under
+  pressure.
+- Shortening throughput through the app in-process: repeated single
+  POST /api/shorten calls against one NDJSON POST /api/shorten/bulk, and
+  the same bulk request again, when every URL is a duplicate.
+"""
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import linktable
+
+LOOKUPS = 100_000
+SINGLE_CALLS = 5_000
+BULK_ITEMS = 100_000
+
+
+def rss() -> dict:
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                key, kb, _ = line.split()
+                values[key[:-1]] = int(kb) * 1024
+    return values
+
+
+def make_db(path: str, n: int) -> list:
+    now = datetime.utcnow()
+    expires = now + timedelta(days=7)
+    codes = [f"c{i:07x}" for i in range(n)]
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE links ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, code TEXT NOT NULL UNIQUE, long_url TEXT NOT NULL, "
+        "created_at TEXT NOT NULL, expires_at TEXT NOT NULL)"
+    )
+    conn.execute("CREATE TABLE clicks (code TEXT PRIMARY KEY, clicks INTEGER NOT NULL)")
+    conn.execute("CREATE TABLE click_series (code TEXT PRIMARY KEY, data BLOB NOT NULL)")
+    conn.executemany(
+        "INSERT INTO links (code, long_url, created_at, expires_at) VALUES (?, ?, ?, ?)",
+        ((c, f"https://example.com/articles/{c}?utm_source=bench", now.isoformat(), expires.isoformat()) for c in codes),
+    )
+    conn.commit()
+    conn.close()
+    return codes
+
+
+def table_benchmark(n: int):
+    directory = tempfile.mkdtemp()
+    db_file = os.path.join(directory, "shortener.db")
+    codes = make_db(db_file, n)
+    sample = random.sample(codes, min(LOOKUPS, n))
+
+    started = time.perf_counter()
+    linktable.merge(db_file, directory)
+    print(f"merge of {n:,} links: {time.perf_counter() - started:.1f}s")
+
+    before = rss()
+    started = time.perf_counter()
+    table = linktable.LinkTable(linktable.table_path(directory, 1))
+    print(f"table open: {(time.perf_counter() - started) * 1000:.2f} ms, "
+          f"{os.path.getsize(table.path) / n:.0f} bytes/link on disk")
+    started = time.perf_counter()
+    for code in sample:
+        table.get(code)
+    elapsed = time.perf_counter() - started
+    print(f"table lookup: {elapsed / len(sample) * 1e6:.2f} us")
+    for i in range(0, n, max(1, n // LOOKUPS)):
+        table.get(codes[i])
+    after = rss()
+    print(f"table resident after {LOOKUPS:,} spread lookups: "
+          f"anon {(after['RssAnon'] - before['RssAnon']) / n:.1f} B/link, "
+          f"file {(after['RssFile'] - before['RssFile']) / n:.1f} B/link (shared)")
+    table.close()
+
+    # The previous startup path: every row parsed into a dict of dicts.
+    before = rss()
+    started = time.perf_counter()
+    url_db = {}
+    conn = sqlite3.connect(db_file)
+    for code, long_url, created_at, expires_at in conn.execute("SELECT code, long_url, created_at, expires_at FROM links"):
+        url_db[code] = {
+            "long_url": long_url,
+            "created_at": datetime.fromisoformat(created_at),
+            "expires_at": datetime.fromisoformat(expires_at)
+        }
+    conn.close()
+    elapsed = time.perf_counter() - started
+    after = rss()
+    print(f"dict load: {elapsed * 1000:.0f} ms, anon {(after['RssAnon'] - before['RssAnon']) / n:.1f} B/link per worker")
+
+
+async def shorten_benchmark():
+    import httpx
+    os.environ["SHORTENER_DB"] = os.path.join(tempfile.mkdtemp(), "shortener.db")
+    import main as shortener
+    async with shortener.app.router.lifespan_context(shortener.app):
+        transport = httpx.ASGITransport(app=shortener.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            started = time.perf_counter()
+            for i in range(SINGLE_CALLS):
+                response = await client.post("/api/shorten", json={"long_url": f"https://example.com/single/{i}"})
+                response.raise_for_status()
+            elapsed = time.perf_counter() - started
+            print(f"{'single calls':>18}: {SINGLE_CALLS / elapsed:8.0f} links/s")
+
+            body = "\n".join(json.dumps({"long_url": f"https://example.com/bulk/{i}"}) for i in range(BULK_ITEMS))
+            for label in ("bulk, new URLs", "bulk, duplicates"):
+                started = time.perf_counter()
+                response = await client.post("/api/shorten/bulk", content=body)
+                response.raise_for_status()
+                created = sum(json.loads(line)["created"] for line in response.text.splitlines())
+                elapsed = time.perf_counter() - started
+                print(f"{label:>18}: {BULK_ITEMS / elapsed:8.0f} links/s ({created} created)")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    table_benchmark(n)
+    asyncio.run(shorten_benchmark())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Memory-mapped, read-only hash table of short links.
+
+One file per generation, `links-<gen>.tbl`:
+
+    header   magic, capacity, count, watermark (highest links.id
+             included), heap offset, expiries offset               64 bytes
+    slots    capacity x 32 bytes: code hash u64, record offset u64,
+             created_at u32, expires_at u32, flags u32, padding
+    heap     records: code length u16, url length u32, code, url
+    expiries count x u32, every expires_at in ascending order
+
+Lookups hash the code with blake2b (stable across processes, unlike
+`hash()`) and probe linearly. Opening a table only maps the file, so startup
+cost does not depend on its size, and every worker shares the same page
+cache pages. The sorted expiries answer how many links have expired with
+one binary search.
+"""
+import hashlib
+import mmap
+import os
+import sqlite3
+import struct
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+MAGIC = b"LNKTBL02"
+HEADER = struct.Struct("<8sQQQQQ")
+HEADER_SIZE = 64
+SLOT = struct.Struct("<QQIII4x")
+RECORD = struct.Struct("<HI")
+LOAD_FACTOR = 0.6
+# A merge lock older than this is left over from a crashed merge.
+MERGE_LOCK_STALE = 3600
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def code_hash(code: bytes) -> int:
+    # 0 is reserved for empty slots.
+    return int.from_bytes(hashlib.blake2b(code, digest_size=8).digest(), "little") or 1
+
+
+def to_epoch(dt: datetime) -> int:
+    return int((dt - EPOCH).total_seconds())
+
+
+def from_epoch(seconds: int) -> datetime:
+    return datetime.utcfromtimestamp(seconds)
+
+
+def table_path(directory: str, gen: int) -> str:
+    return os.path.join(directory, f"links-{gen:08d}.tbl")
+
+
+def table_gens(directory: str) -> list:
+    gens = []
+    for name in os.listdir(directory):
+        if name.startswith("links-") and name.endswith(".tbl"):
+            try:
+                gens.append(int(name[6:-4]))
+            except ValueError:
+                pass
+    return sorted(gens)
+
+
+class LinkTable:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.capacity = 0
+        self.count = 0
+        self.watermark = 0
+        self._mm = None
+        self._file = None
+        self._expiries = None
+        if path is not None:
+            self._file = open(path, "rb")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.capacity, self.count, self.watermark, _, expiries = HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a link table")
+            self._mask = self.capacity - 1
+            self._expiries = memoryview(self._mm)[expiries:expiries + 4 * self.count].cast("I")
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self._mm is not None:
+            # The view must go first; an mmap with exports cannot close.
+            self._expiries.release()
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+
+    def expired(self, now: datetime) -> int:
+        """How many links in the table have expired by `now`."""
+        if not self.count:
+            return 0
+        return bisect_right(self._expiries, to_epoch(now))
+
+    def get(self, code: str) -> Optional[Tuple[str, datetime, datetime, int]]:
+        """Returns (long_url, created_at, expires_at, flags) or None."""
+        if not self.count:
+            return None
+        mm = self._mm
+        raw = code.encode("utf-8")
+        h = code_hash(raw)
+        i = h & self._mask
+        while True:
+            slot_hash, offset, created_at, expires_at, flags = SLOT.unpack_from(mm, HEADER_SIZE + i * SLOT.size)
+            if not offset:
+                return None
+            if slot_hash == h:
+                code_len, url_len = RECORD.unpack_from(mm, offset)
+                start = offset + RECORD.size
+                if mm[start:start + code_len] == raw:
+                    url = mm[start + code_len:start + code_len + url_len].decode("utf-8")
+                    return url, from_epoch(created_at), from_epoch(expires_at), flags
+            i = (i + 1) & self._mask
+
+
+def write_table(path: str, rows: Iterable[tuple], count: int, watermark: int):
+    """Writes `count` rows of (code, long_url, created_at, expires_at) to `path` atomically."""
+    capacity = 8
+    while capacity * LOAD_FACTOR < count:
+        capacity *= 2
+    mask = capacity - 1
+    slots = bytearray(capacity * SLOT.size)
+    heap_start = HEADER_SIZE + len(slots)
+    expiries = array("I")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.seek(heap_start)
+        offset = heap_start
+        for code, long_url, created_at, expires_at in rows:
+            raw_code = code.encode("utf-8")
+            raw_url = long_url.encode("utf-8")
+            h = code_hash(raw_code)
+            i = h & mask
+            while SLOT.unpack_from(slots, i * SLOT.size)[1]:
+                i = (i + 1) & mask
+            SLOT.pack_into(slots, i * SLOT.size, h, offset, to_epoch(created_at), to_epoch(expires_at), 0)
+            expiries.append(to_epoch(expires_at))
+            record = RECORD.pack(len(raw_code), len(raw_url)) + raw_code + raw_url
+            f.write(record)
+            offset += len(record)
+        # Aligned, so the array can be read in place through the map.
+        expiries_start = (offset + 7) & ~7
+        f.write(b"\0" * (expiries_start - offset))
+        f.write(array("I", sorted(expiries)).tobytes())
+        f.seek(0)
+        header = HEADER.pack(MAGIC, capacity, count, watermark, heap_start, expiries_start)
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+        f.write(slots)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def merge(db_file: str, directory: str) -> int:
+    """Rebuilds the table from every unexpired link in SQLite.
+
+    Runs in a worker process. Returns the new generation.
+    """
+    lock = os.path.join(directory, "merge.lock")
+    try:
+        if time.time() - os.path.getmtime(lock) > MERGE_LOCK_STALE:
+            os.remove(lock)
+    except OSError:
+        pass
+    fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    try:
+        gens = table_gens(directory)
+        gen = gens[-1] + 1 if gens else 1
+        now = datetime.utcnow().isoformat()
+        conn = sqlite3.connect(db_file)
+        try:
+            conn.execute("DELETE FROM clicks WHERE code IN (SELECT code FROM links WHERE expires_at <= ?)", (now,))
+            conn.execute("DELETE FROM click_series WHERE code IN (SELECT code FROM links WHERE expires_at <= ?)", (now,))
+            conn.execute("DELETE FROM links WHERE expires_at <= ?", (now,))
+            conn.commit()
+            watermark = conn.execute("SELECT COALESCE(MAX(id), 0) FROM links").fetchone()[0]
+            count = conn.execute("SELECT COUNT(*) FROM links WHERE id <= ?", (watermark,)).fetchone()[0]
+            rows = conn.execute(
+                "SELECT code, long_url, created_at, expires_at FROM links WHERE id <= ?", (watermark,)
+            )
+            write_table(
+                table_path(directory, gen),
+                ((c, u, datetime.fromisoformat(ca), datetime.fromisoformat(ea)) for c, u, ca, ea in rows),
+                count,
+                watermark,
+            )
+        finally:
+            conn.close()
+        for old in gens[:-1]:
+            try:
+                os.remove(table_path(directory, old))
+            except OSError:
+                pass
+        return gen
+    finally:
+        os.close(fd)
+        os.remove(lock)
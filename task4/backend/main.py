@@ -1,12 +1,431 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
 import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, HttpUrl
-from typing import Optional
+from pydantic import BaseModel, Field, HttpUrl, ValidationError
+from typing import Dict, List, Optional, Set
 
-app = FastAPI()
+import analytics
+import linktable
+
+EXPIRATION_DAYS = 7
+
+# Expiry is tracked in minute-wide buckets: bucket id -> codes expiring in
+# that minute, plus a min-heap of bucket ids. Scheduling and unscheduling a
+# link are O(1) set operations and the purge task always works on the
+# earliest bucket.
+EXPIRY_BUCKET_SECONDS = 60
+PURGE_INTERVAL = float(os.getenv("PURGE_INTERVAL", "1"))
+PURGE_SLICE_MS = float(os.getenv("PURGE_SLICE_MS", "2"))
+
+# Clicks are counted in memory on the event loop and written behind to
+# SQLite every CLICK_FLUSH_INTERVAL seconds, or sooner once
+# CLICK_FLUSH_THRESHOLD clicks are pending.
+CLICK_FLUSH_INTERVAL = float(os.getenv("CLICK_FLUSH_INTERVAL", "1"))
+CLICK_FLUSH_THRESHOLD = int(os.getenv("CLICK_FLUSH_THRESHOLD", "10000"))
+
+DB_FILE = os.getenv("SHORTENER_DB", "data/shortener.db")
+DATA_DIR = os.path.dirname(DB_FILE) or "."
+os.makedirs(DATA_DIR, exist_ok=True)
+
+# Links live in a read-only memory-mapped table (linktable.py) plus the
+# SQLite rows written after it was built. Every LINK_MERGE_INTERVAL seconds
+# workers pick up rows written by other workers and switch to a newer
+# table if one exists; once LINK_MERGE_THRESHOLD rows are outside the
+# table, one worker rebuilds it in a separate process.
+LINK_MERGE_INTERVAL = float(os.getenv("LINK_MERGE_INTERVAL", "10"))
+LINK_MERGE_THRESHOLD = int(os.getenv("LINK_MERGE_THRESHOLD", "100000"))
+
+# Generated codes are CODE_LENGTH random base62 characters, so one code
+# says nothing about any other. A collision with an existing code is caught
+# by the unique constraint and a new code is drawn.
+CODE_LENGTH = 8
+CODE_SPACE = 62 ** CODE_LENGTH
+BASE62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+# Bulk requests are NDJSON, one {long_url, ttl_days?} object per line,
+# processed and answered BULK_CHUNK lines at a time.
+BULK_CHUNK = int(os.getenv("BULK_CHUNK", "1000"))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "100000"))
+
+EPOCH = datetime(1970, 1, 1)
+
+logger = logging.getLogger(__name__)
+
+# Links newer than the table: code -> {long_url, created_at, expires_at, rowid}.
+url_db = {}
+link_table = linktable.LinkTable()
+tail_rowid = 0
+merge_stats = {"merges": 0, "merge_errors": 0}
+
+pending_clicks: Dict[str, int] = {}
+flushing_clicks: Dict[str, int] = {}
+# Per-link minute/hour/day rollups and unique visitor sketches collected
+# since the last flush; flushed alongside the click counts.
+pending_series: Dict[str, analytics.ClickSeries] = {}
+flushing_series: Dict[str, analytics.ClickSeries] = {}
+pending_total = 0
+flush_wanted = asyncio.Event()
+# Orders flushes against get_stats so a batch is never counted twice or
+# missed while it moves from memory to disk. Redirects never take it.
+clicks_lock = threading.Lock()
+
+_local = threading.local()
+
+def db() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = sqlite3.connect(DB_FILE)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def init_db():
+    conn = db()
+    # AUTOINCREMENT, so an id is never handed out twice even after the
+    # newest rows are purged. Workers and link tables use it as their
+    # watermark, and a reused id at or below one would never be read.
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS links ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, code TEXT NOT NULL UNIQUE, long_url TEXT NOT NULL, "
+        "created_at TEXT NOT NULL, expires_at TEXT NOT NULL)"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS clicks (code TEXT PRIMARY KEY, clicks INTEGER NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS click_series (code TEXT PRIMARY KEY, data BLOB NOT NULL)")
+    # Reverse index for returning the existing code of a known long URL.
+    conn.execute("CREATE INDEX IF NOT EXISTS links_long_url ON links (long_url)")
+    conn.commit()
+
+def next_code() -> str:
+    n = secrets.randbelow(CODE_SPACE)
+    chars = []
+    for _ in range(CODE_LENGTH):
+        n, digit = divmod(n, 62)
+        chars.append(BASE62[digit])
+    return "".join(chars)
+
+def insert_link(conn: sqlite3.Connection, long_url: str, now: datetime, expires_at: datetime) -> tuple:
+    """Inserts a link under a fresh code without committing. Returns (code, rowid)."""
+    while True:
+        code = next_code()
+        try:
+            rowid = conn.execute(
+                "INSERT INTO links (code, long_url, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                (code, long_url, now.isoformat(), expires_at.isoformat()),
+            ).lastrowid
+            return code, rowid
+        except sqlite3.IntegrityError:
+            pass  # taken; draw another
+
+def insert_custom_link(conn: sqlite3.Connection, code: str, long_url: str, now: datetime, expires_at: datetime) -> int:
+    """Inserts a link under a caller-chosen code without committing. Returns the rowid.
+
+    A code that is taken is reclaimed only if its link has expired; the
+    row may come from another worker, so this is decided by the database
+    rather than by what this worker has loaded.
+    """
+    row = (code, long_url, now.isoformat(), expires_at.isoformat())
+    insert = "INSERT INTO links (code, long_url, created_at, expires_at) VALUES (?, ?, ?, ?)"
+    try:
+        return conn.execute(insert, row).lastrowid
+    except sqlite3.IntegrityError:
+        pass
+    if not conn.execute("DELETE FROM links WHERE code = ? AND expires_at <= ?", (code, now.isoformat())).rowcount:
+        raise HTTPException(status_code=400, detail="Custom short code already taken")
+    conn.execute("DELETE FROM clicks WHERE code = ?", (code,))
+    conn.execute("DELETE FROM click_series WHERE code = ?", (code,))
+    return conn.execute(insert, row).lastrowid
+
+def find_links(long_urls, now: datetime) -> Dict[str, tuple]:
+    """Maps each long URL that has a live link to (code, expires_at)."""
+    long_urls = list(long_urls)
+    found = {}
+    conn = db()
+    for i in range(0, len(long_urls), 500):
+        batch = long_urls[i:i + 500]
+        rows = conn.execute(
+            f"SELECT long_url, code, expires_at FROM links WHERE long_url IN ({','.join('?' * len(batch))}) "
+            "AND expires_at > ?",
+            (*batch, now.isoformat()),
+        )
+        for long_url, code, expires_at in rows:
+            expires_at = datetime.fromisoformat(expires_at)
+            if long_url not in found or expires_at > found[long_url][1]:
+                found[long_url] = (code, expires_at)
+    return found
+
+def remember_link(short_code: str, long_url: str, now: datetime, expires_at: datetime, rowid: int):
+    forget_expiry(short_code)
+    url_db[short_code] = {
+        "long_url": long_url,
+        "created_at": now,
+        "expires_at": expires_at,
+        "rowid": rowid
+    }
+    schedule_expiry(short_code, expires_at)
+
+def open_table() -> bool:
+    """Switches to the newest table on disk. Returns True if it changed."""
+    global link_table
+    gens = linktable.table_gens(DATA_DIR)
+    if not gens:
+        return False
+    path = linktable.table_path(DATA_DIR, gens[-1])
+    if path == link_table.path:
+        return False
+    # The old map is left to the garbage collector rather than closed, so
+    # lookups already running in threadpool handlers can finish on it.
+    link_table = linktable.LinkTable(path)
+    # Links now in the table leave memory and the expiry index; the table
+    # counts its own expired links. A snapshot, since threadpool handlers
+    # add links while this runs.
+    for code, entry in list(url_db.items()):
+        if entry["rowid"] <= link_table.watermark and url_db.get(code) is entry:
+            unschedule_expiry(code, entry["expires_at"])
+            del url_db[code]
+    return True
+
+def read_tail(after: int) -> list:
+    return db().execute(
+        "SELECT id, code, long_url, created_at, expires_at FROM links WHERE id > ? ORDER BY id",
+        (after,),
+    ).fetchall()
+
+def load_tail(rows: list):
+    global tail_rowid
+    for row in rows:
+        tail_rowid = max(tail_rowid, row[0])
+        if row[0] > link_table.watermark:
+            cache_row(row)
+
+def cache_row(row: tuple) -> dict:
+    rowid, code, long_url, created_at, expires_at = row
+    remember_link(code, long_url, datetime.fromisoformat(created_at), datetime.fromisoformat(expires_at), rowid)
+    return url_db[code]
+
+def lookup(short_code: str) -> Optional[dict]:
+    entry = url_db.get(short_code)
+    if entry is not None:
+        return entry
+    row = link_table.get(short_code)
+    if row is None:
+        return None
+    long_url, created_at, expires_at, _ = row
+    return {"long_url": long_url, "created_at": created_at, "expires_at": expires_at}
+
+def load_link(short_code: str) -> Optional[dict]:
+    """Reads one link from SQLite and caches it; None if there is no row.
+
+    For codes this worker has no live link for: another worker may have
+    created or reclaimed it since the last tail read.
+    """
+    row = db().execute(
+        "SELECT id, code, long_url, created_at, expires_at FROM links WHERE code = ?", (short_code,)
+    ).fetchone()
+    return cache_row(row) if row is not None else None
+
+def find_link(short_code: str) -> Optional[dict]:
+    """lookup(), falling back to SQLite on a miss. Does disk I/O only then."""
+    entry = lookup(short_code)
+    if entry is None or is_expired(entry, datetime.utcnow()):
+        entry = load_link(short_code) or entry
+    return entry
+
+def load_series(short_code: str) -> analytics.ClickSeries:
+    row = db().execute("SELECT data FROM click_series WHERE code = ?", (short_code,)).fetchone()
+    return analytics.ClickSeries.from_bytes(row[0]) if row else analytics.ClickSeries()
+
+def write_clicks(batch: Dict[str, int], series_batch: Dict[str, analytics.ClickSeries]):
+    global flushing_clicks, flushing_series
+    with clicks_lock:
+        conn = db()
+        try:
+            conn.executemany(
+                "INSERT INTO clicks (code, clicks) VALUES (?, ?) "
+                "ON CONFLICT(code) DO UPDATE SET clicks = clicks + excluded.clicks",
+                batch.items(),
+            )
+            # Read-merge-write in the same transaction, so deltas from other
+            # workers are folded in rather than overwritten.
+            for code, delta in series_batch.items():
+                series = load_series(code)
+                series.merge(delta)
+                conn.execute("INSERT OR REPLACE INTO click_series (code, data) VALUES (?, ?)", (code, series.to_bytes()))
+            conn.commit()
+        except BaseException:
+            # The caller re-queues the whole batch; nothing of it may stay
+            # behind in an open transaction on this thread's connection.
+            conn.rollback()
+            raise
+        flushing_clicks = {}
+        flushing_series = {}
+
+def delete_links(codes: List[str]):
+    conn = db()
+    now = datetime.utcnow().isoformat()
+    # Only rows that are still expired: another worker may have reclaimed
+    # the code for a new link that this worker has not loaded yet.
+    try:
+        conn.executemany("DELETE FROM links WHERE code = ? AND expires_at <= ?", ((c, now) for c in codes))
+        orphaned = [(c, c) for c in codes]
+        conn.executemany("DELETE FROM clicks WHERE code = ? AND NOT EXISTS (SELECT 1 FROM links WHERE code = ?)", orphaned)
+        conn.executemany(
+            "DELETE FROM click_series WHERE code = ? AND NOT EXISTS (SELECT 1 FROM links WHERE code = ?)", orphaned
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+async def flush_clicks():
+    global pending_clicks, flushing_clicks, pending_series, flushing_series, pending_total
+    if not pending_clicks:
+        return
+    with clicks_lock:
+        batch = flushing_clicks = pending_clicks
+        series_batch = flushing_series = pending_series
+        pending_clicks = {}
+        pending_series = {}
+        pending_total = 0
+    try:
+        await asyncio.to_thread(write_clicks, batch, series_batch)
+    except Exception:
+        logger.exception("Click flush failed, will retry")
+        with clicks_lock:
+            for code, n in batch.items():
+                pending_clicks[code] = pending_clicks.get(code, 0) + n
+            for code, delta in series_batch.items():
+                series = pending_series.get(code)
+                if series is None:
+                    pending_series[code] = delta
+                else:
+                    series.merge(delta)
+            flushing_clicks = {}
+            flushing_series = {}
+
+async def flush_loop():
+    while True:
+        try:
+            await asyncio.wait_for(flush_wanted.wait(), timeout=CLICK_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        flush_wanted.clear()
+        await flush_clicks()
+
+expiry_buckets: Dict[int, Set[str]] = {}
+expiry_heap: List[int] = []
+expiry_lock = threading.Lock()
+expiry_stats = {"purged": 0}
+
+def expiry_bucket(expires_at: datetime) -> int:
+    return int((expires_at - EPOCH).total_seconds() // EXPIRY_BUCKET_SECONDS)
+
+def schedule_expiry(short_code: str, expires_at: datetime):
+    bucket = expiry_bucket(expires_at)
+    with expiry_lock:
+        codes = expiry_buckets.get(bucket)
+        if codes is None:
+            codes = expiry_buckets[bucket] = set()
+            heapq.heappush(expiry_heap, bucket)
+        codes.add(short_code)
+
+def forget_expiry(short_code: str):
+    """Unschedules the expired link a reclaimed custom code replaces, if loaded."""
+    old = url_db.get(short_code)
+    if old is not None:
+        unschedule_expiry(short_code, old["expires_at"])
+
+def unschedule_expiry(short_code: str, expires_at: datetime):
+    with expiry_lock:
+        codes = expiry_buckets.get(expiry_bucket(expires_at))
+        if codes is not None:
+            codes.discard(short_code)
+
+def purge_expired(now: datetime, budget: float, purged: List[str]) -> bool:
+    """Drops links from fully elapsed buckets for at most `budget` seconds.
+
+    Purged codes are appended to `purged`. Returns True if due links are
+    left for another slice.
+    """
+    deadline = time.perf_counter() + budget
+    due = expiry_bucket(now)
+    with expiry_lock:
+        while expiry_heap and expiry_heap[0] < due:
+            codes = expiry_buckets[expiry_heap[0]]
+            while codes:
+                if time.perf_counter() >= deadline:
+                    return True
+                code = codes.pop()
+                url_db.pop(code, None)
+                purged.append(code)
+                expiry_stats["purged"] += 1
+            del expiry_buckets[heapq.heappop(expiry_heap)]
+    return False
+
+async def purge_loop():
+    while True:
+        await asyncio.sleep(PURGE_INTERVAL)
+        # Small slices with a yield in between, so redirects never wait
+        # behind a large purge.
+        purged = []
+        try:
+            while purge_expired(datetime.utcnow(), PURGE_SLICE_MS / 1000, purged):
+                await asyncio.sleep(0)
+            if purged:
+                await asyncio.to_thread(delete_links, purged)
+        except Exception:
+            # The links are already gone from memory; their rows go with
+            # the next table merge, which deletes every expired row.
+            logger.exception("Purge of %d expired links failed", len(purged))
+
+async def merge_loop(pool: ProcessPoolExecutor):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(LINK_MERGE_INTERVAL)
+        if len(url_db) >= LINK_MERGE_THRESHOLD:
+            try:
+                await loop.run_in_executor(pool, linktable.merge, DB_FILE, DATA_DIR)
+                merge_stats["merges"] += 1
+            except FileExistsError:
+                pass  # another worker is merging
+            except Exception:
+                merge_stats["merge_errors"] += 1
+                logger.exception("Link table merge failed")
+        try:
+            open_table()
+            load_tail(await asyncio.to_thread(read_tail, tail_rowid))
+        except Exception:
+            # Retried next interval; tail_rowid only advances on success.
+            logger.exception("Reading new links failed")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    open_table()
+    load_tail(read_tail(link_table.watermark))
+    pool = ProcessPoolExecutor(max_workers=1)
+    purger = asyncio.create_task(purge_loop())
+    flusher = asyncio.create_task(flush_loop())
+    merger = asyncio.create_task(merge_loop(pool))
+    yield
+    purger.cancel()
+    flusher.cancel()
+    merger.cancel()
+    pool.shutdown(cancel_futures=True)
+    await flush_clicks()
+
+app = FastAPI(lifespan=lifespan)
 
 
 origins = ["http://localhost:3000"]
@@ -18,61 +437,224 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-url_db = {}
-
-EXPIRATION_DAYS = 7 
-
 class URLCreate(BaseModel):
     long_url: HttpUrl
     custom_code: Optional[str] = None
+    ttl_days: Optional[float] = Field(None, gt=0, le=3650)
+
+class URLBulkItem(BaseModel):
+    long_url: HttpUrl
+    ttl_days: Optional[float] = Field(None, gt=0, le=3650)
+
+def is_expired(entry: dict, now: datetime) -> bool:
+    return now >= entry["expires_at"]
 
 @app.post("/api/shorten")
 def create_short_url(url_data: URLCreate, request: Request):
     long_url = str(url_data.long_url)
+    now = datetime.utcnow()
+    expires_at = now + timedelta(days=url_data.ttl_days or EXPIRATION_DAYS)
 
     if url_data.custom_code:
         short_code = url_data.custom_code
-        if short_code in url_db:
-            raise HTTPException(status_code=400, detail="Custom short code already taken")
+        existing = lookup(short_code)
+        if existing is not None:
+            if not is_expired(existing, now):
+                raise HTTPException(status_code=400, detail="Custom short code already taken")
     else:
-        short_code = secrets.token_urlsafe(6)
-        while short_code in url_db:
-            short_code = secrets.token_urlsafe(6)
+        existing = find_links([long_url], now).get(long_url)
+        # Reused only if it lives at least as long as this request asks.
+        if existing is not None and existing[1] >= expires_at:
+            short_code, existing_expires_at = existing
+            return {
+                "short_url": f"{request.base_url}{short_code}",
+                "clicks": count_clicks(short_code),
+                "expires_at": existing_expires_at.isoformat()
+            }
 
-    url_db[short_code] = {
-        "long_url": long_url,
-        "clicks": 0,
-        "created_at": datetime.utcnow()
-    }
+    conn = db()
+    try:
+        if url_data.custom_code:
+            rowid = insert_custom_link(conn, short_code, long_url, now, expires_at)
+        else:
+            short_code, rowid = insert_link(conn, long_url, now, expires_at)
+        conn.commit()
+    except BaseException:
+        # Never leave this thread's connection inside a write transaction.
+        conn.rollback()
+        raise
+    remember_link(short_code, long_url, now, expires_at, rowid)
 
     short_url = f"{request.base_url}{short_code}"
     return {
         "short_url": short_url,
-        "clicks": 0
+        "clicks": 0,
+        "expires_at": expires_at.isoformat()
+    }
+
+def shorten_chunk(items: List[URLBulkItem]) -> List[tuple]:
+    """Returns (code, expires_at, created) per item.
+
+    A known URL's live link is reused if it expires no earlier than the
+    item's TTL asks for.
+    """
+    now = datetime.utcnow()
+    long_urls = [str(item.long_url) for item in items]
+    known = find_links(set(long_urls), now)
+    conn = db()
+    created = []
+    results = []
+    try:
+        for item, long_url in zip(items, long_urls):
+            found = known.get(long_url)
+            expires_at = now + timedelta(days=item.ttl_days or EXPIRATION_DAYS)
+            if found is not None and found[1] >= expires_at:
+                results.append((*found, False))
+                continue
+            code, rowid = insert_link(conn, long_url, now, expires_at)
+            if found is None or expires_at > found[1]:
+                known[long_url] = (code, expires_at)
+            created.append((code, long_url, now, expires_at, rowid))
+            results.append((code, expires_at, True))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    for link in created:
+        remember_link(*link)
+    return results
+
+@app.post("/api/shorten/bulk")
+async def create_short_urls_bulk(request: Request):
+    # The body is parsed line by line as it arrives; the response streams
+    # one NDJSON line per non-blank input line, in order, as each chunk is
+    # stored. Line numbers count every input line, blank ones included.
+    items: List[tuple] = []
+    line_no = 0
+    buffer = b""
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line_no, line in enumerate(lines, line_no + 1):
+            if line.strip():
+                items.append((line_no, parse_bulk_line(line)))
+        if len(items) > BULK_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ITEMS} URLs per request")
+    if buffer.strip():
+        items.append((line_no + 1, parse_bulk_line(buffer)))
+    base_url = str(request.base_url)
+
+    async def ndjson():
+        for start in range(0, len(items), BULK_CHUNK):
+            chunk = items[start:start + BULK_CHUNK]
+            valid = [item for _, item in chunk if isinstance(item, URLBulkItem)]
+            results = iter(await asyncio.to_thread(shorten_chunk, valid) if valid else [])
+            lines = []
+            for line_no, item in chunk:
+                if isinstance(item, str):
+                    lines.append(json.dumps({"line": line_no, "error": item}))
+                    continue
+                code, expires_at, created = next(results)
+                lines.append(json.dumps({
+                    "line": line_no,
+                    "long_url": str(item.long_url),
+                    "short_url": f"{base_url}{code}",
+                    "expires_at": expires_at.isoformat(),
+                    "created": created
+                }))
+            yield "\n".join(lines) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+def parse_bulk_line(line: bytes):
+    """A URLBulkItem, or the validation error message."""
+    try:
+        return URLBulkItem.model_validate_json(line)
+    except ValidationError as e:
+        error = e.errors()[0]
+        return f"{'.'.join(map(str, error['loc']))}: {error['msg']}" if error["loc"] else error["msg"]
+
+@app.get("/api/metrics/expiry")
+def get_expiry_metrics():
+    now = datetime.utcnow()
+    due = expiry_bucket(now)
+    with expiry_lock:
+        expired = sum(len(expiry_buckets[b]) for b in expiry_heap if b < due)
+    # Links in the table are not in the expiry index; their expired rows
+    # are dropped by the next merge rather than purged.
+    table = link_table
+    table_expired = table.expired(now)
+    return {
+        "live": len(url_db) - expired + len(table) - table_expired,
+        "expired": expired + table_expired,
+        "purged": expiry_stats["purged"],
+        "buckets": len(expiry_heap)
+    }
+
+@app.get("/api/metrics/links")
+def get_link_metrics():
+    return {
+        "table_links": len(link_table),
+        "table_watermark": link_table.watermark,
+        "recent_links": len(url_db),
+        **merge_stats
     }
 
 @app.get("/{short_code}")
-def redirect_to_long_url(short_code: str):
-    entry = url_db.get(short_code)
+async def redirect_to_long_url(short_code: str, request: Request):
+    # Runs on the event loop, so the counter update cannot race. Only a
+    # miss goes to disk, in a worker thread.
+    global pending_total
+    entry = lookup(short_code)
+    if entry is None or is_expired(entry, datetime.utcnow()):
+        entry = await asyncio.to_thread(load_link, short_code) or entry
     if not entry:
         raise HTTPException(status_code=404, detail="Short URL not found")
 
-    if datetime.utcnow() - entry["created_at"] > timedelta(days=EXPIRATION_DAYS):
+    if is_expired(entry, datetime.utcnow()):
         raise HTTPException(status_code=404, detail="Short URL has expired")
 
-    entry["clicks"] += 1
+    pending_clicks[short_code] = pending_clicks.get(short_code, 0) + 1
+    pending_total += 1
+    series = pending_series.get(short_code)
+    if series is None:
+        series = pending_series[short_code] = analytics.ClickSeries()
+    client = request.client.host if request.client else ""
+    series.add(time.time(), analytics.visitor_hash(client, request.headers.get("user-agent", "")))
+    if pending_total >= CLICK_FLUSH_THRESHOLD:
+        flush_wanted.set()
 
     return RedirectResponse(url=entry["long_url"])
 
+def count_clicks(short_code: str) -> int:
+    with clicks_lock:
+        row = db().execute("SELECT clicks FROM clicks WHERE code = ?", (short_code,)).fetchone()
+        persisted = row[0] if row else 0
+        return persisted + flushing_clicks.get(short_code, 0) + pending_clicks.get(short_code, 0)
+
 @app.get("/api/stats/{short_code}")
 def get_stats(short_code: str):
-    entry = url_db.get(short_code)
+    entry = find_link(short_code)
     if not entry:
         raise HTTPException(status_code=404, detail="Short URL not found")
 
     return {
         "short_code": short_code,
         "long_url": entry["long_url"],
-        "clicks": entry["clicks"],
-        "created_at": entry["created_at"].isoformat()
-    }
\ No newline at end of file
+        "clicks": count_clicks(short_code),
+        "created_at": entry["created_at"].isoformat(),
+        "expires_at": entry["expires_at"].isoformat()
+    }
+
+@app.get("/api/stats/{short_code}/timeseries")
+def get_timeseries(short_code: str):
+    entry = find_link(short_code)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Short URL not found")
+
+    with clicks_lock:
+        series = load_series(short_code)
+        for delta in (flushing_series.get(short_code), pending_series.get(short_code)):
+            if delta is not None:
+                series.merge(delta)
+    return {"short_code": short_code, **series.report(time.time())}
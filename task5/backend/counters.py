@@ -0,0 +1,58 @@
+"""Vote counters sharded per thread and summed on read."""
+import threading
+from contextlib import contextmanager
+from typing import Dict, Hashable, Iterator, List
+
+
+class _Shard:
+    __slots__ = ("lock", "counts")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: Dict[Hashable, int] = {}
+
+
+class ShardedCounter:
+    """Counts per key, spread over a fixed set of shards.
+
+    Each thread increments the shard picked by a hash of its thread id, so writers on
+    different shards never wait on each other. The shard count is fixed:
+    worker threads come and go (AnyIO retires idle ones), and a shard per
+    thread would grow without bound. Reads sum every shard without locking,
+    which is safe under the GIL and at worst misses increments in flight.
+    """
+
+    def __init__(self, shard_bits: int = 5):
+        self._bits = shard_bits
+        self._shards: List[_Shard] = [_Shard() for _ in range(1 << shard_bits)]
+
+    def _shard(self) -> _Shard:
+        # Thread ids are aligned stack addresses, so their low bits are all
+        # the same; Fibonacci hashing spreads them by their high bits.
+        h = (threading.get_ident() * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        return self._shards[h >> (64 - self._bits)]
+
+    @contextmanager
+    def hold(self) -> Iterator[Dict[Hashable, int]]:
+        """Yields this thread's shard's counts with the shard locked."""
+        shard = self._shard()
+        with shard.lock:
+            yield shard.counts
+
+    @contextmanager
+    def freeze(self):
+        """Blocks every writer, so a consistent copy can be taken."""
+        for shard in self._shards:
+            shard.lock.acquire()
+        try:
+            yield
+        finally:
+            for shard in self._shards:
+                shard.lock.release()
+
+    def add(self, key: Hashable, n: int = 1):
+        with self.hold() as counts:
+            counts[key] = counts.get(key, 0) + n
+
+    def get(self, key: Hashable) -> int:
+        return sum(shard.counts.get(key, 0) for shard in self._shards)
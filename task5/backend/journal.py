@@ -0,0 +1,222 @@
+"""Append-only vote journal with group commit.
+
+Segments are `votes-<gen>.jsonl` next to the snapshot, one JSON array per
+line:
+
+    ["c", poll_id, question, [option, ...], one_vote_per_client]   # poll created
+    ["v", poll_id, option_key]                                     # one vote
+    ["v", poll_id, option_key, voter]                              # one vote, one per voter
+
+`voter` is the voter's hash (see voters.py) in hex, present only on polls
+with one_vote_per_client.
+
+The snapshot (`polls.json`) records the first journal generation it does
+not include, so recovery loads it and replays only the later segments.
+"""
+import json
+import logging
+import os
+import threading
+from typing import Iterator, List, Optional, Tuple
+
+_ROTATE = object()
+
+logger = logging.getLogger(__name__)
+
+
+def _gens(directory: str) -> List[int]:
+    gens = []
+    for name in os.listdir(directory):
+        if name.startswith("votes-") and name.endswith(".jsonl"):
+            try:
+                gens.append(int(name[6:-6]))
+            except ValueError:
+                pass
+    return sorted(gens)
+
+
+def _segment_path(directory: str, gen: int) -> str:
+    return os.path.join(directory, f"votes-{gen:08d}.jsonl")
+
+
+def read_segments(directory: str, from_gen: int) -> Iterator[list]:
+    for gen in _gens(directory):
+        if gen < from_gen:
+            continue
+        with open(_segment_path(directory, gen), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Torn write from a crash: nothing after it was acknowledged.
+                    break
+
+
+def remove_segments(directory: str, below_gen: int):
+    for gen in _gens(directory):
+        if gen < below_gen:
+            os.remove(_segment_path(directory, gen))
+
+
+class Journal:
+    """Queues records from any thread and makes them durable in batches.
+
+    `append()` only queues the line and returns a ticket; `wait(ticket)`
+    blocks until that record is written and fsynced. A single writer thread
+    drains whatever queued up during the previous fsync, so concurrent
+    requests share one fsync.
+
+    A failed write fails only the records it carried: the segment is cut
+    back to its last durable size and reopened for the next batch.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.gen = 0
+        self.commits = 0
+        self.records = 0
+        self._file = None
+        self._file_gen = 0
+        # Bytes of the current segment known to be durable.
+        self._size = 0
+        self._pending: list = []
+        self._queued = 0
+        # Highest ticket written or failed, and the tickets that failed.
+        self._done = 0
+        self._failed: List[Tuple[int, int, Exception]] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._writer: Optional[threading.Thread] = None
+
+    def recover(self, snapshot_gen: int) -> Iterator[list]:
+        """Records written after the snapshot; call before start()."""
+        gens = _gens(self.directory)
+        # Always start a fresh segment so a torn tail is never appended to.
+        self.gen = max(gens[-1] + 1 if gens else 0, snapshot_gen)
+        return read_segments(self.directory, snapshot_gen)
+
+    def start(self):
+        self._file_gen = self.gen
+        self._open()
+        self._writer = threading.Thread(target=self._run, name="vote-journal", daemon=True)
+        self._writer.start()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._writer:
+            self._writer.join()
+        if self._file:
+            self._file.close()
+
+    def append(self, record: list) -> int:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._cond:
+            self._pending.append(line)
+            self._queued += 1
+            self.records += 1
+            self._cond.notify_all()
+            return self._queued
+
+    def rotate(self) -> int:
+        """Sends later records to a new segment. Returns its generation."""
+        with self._cond:
+            self.gen += 1
+            self.records = 0
+            self._pending.append(_ROTATE)
+            self._cond.notify_all()
+            return self.gen
+
+    def wait(self, ticket: int):
+        with self._cond:
+            while self._done < ticket:
+                self._cond.wait()
+            for first, last, error in self._failed:
+                if first <= ticket <= last:
+                    raise error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+            # Records before a rotation go to the old segment and are
+            # settled before the switch, whatever happens after it.
+            lines: List[str] = []
+            failed = False
+            for item in batch:
+                if item is _ROTATE:
+                    failed |= not self._flush(lines)
+                    lines = []
+                    self._next_segment()
+                else:
+                    lines.append(item)
+            failed |= not self._flush(lines)
+            if not failed:
+                with self._cond:
+                    self.commits += 1
+
+    def _flush(self, lines: List[str]) -> bool:
+        """Writes and settles the next len(lines) tickets. Returns False if they failed."""
+        error = None
+        try:
+            self._write("".join(lines))
+        except Exception as e:
+            logger.exception("Vote journal write failed")
+            error = e
+        with self._cond:
+            # Queued records are numbered consecutively, so these are the
+            # tickets right after the last settled one.
+            first = self._done + 1
+            self._done += len(lines)
+            if error is not None and lines:
+                if self._failed and self._failed[-1][1] == first - 1:
+                    # Back-to-back failures share one range, so a disk that
+                    # stays broken does not grow the list.
+                    first = self._failed.pop()[0]
+                self._failed.append((first, self._done, error))
+            self._cond.notify_all()
+        return error is None
+
+    def _open(self):
+        self._file = open(_segment_path(self.directory, self._file_gen), "ab")
+        self._size = os.fstat(self._file.fileno()).st_size
+
+    def _next_segment(self):
+        self._discard()
+        self._file_gen += 1
+        try:
+            self._open()
+        except OSError:
+            # Opened again by the next write.
+            logger.exception("Vote journal segment open failed")
+            self._size = 0
+
+    def _discard(self):
+        file, self._file = self._file, None
+        if file is not None:
+            try:
+                file.close()
+            except OSError:
+                pass
+
+    def _write(self, data: str):
+        if not data:
+            return
+        encoded = data.encode("utf-8")
+        try:
+            if self._file is None:
+                self._file = open(_segment_path(self.directory, self._file_gen), "ab")
+                # Drop whatever a failed write left past the durable end.
+                self._file.truncate(self._size)
+            self._file.write(encoded)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except Exception:
+            self._discard()
+            raise
+        self._size += len(encoded)
@@ -0,0 +1,102 @@
+"""Server-sent events for live poll results.
+
+Writers call `notify()` from any thread. Only the first call after each
+broadcast wakes the event loop; later ones are folded into the next
+broadcast, which goes out at most `max_rate` times per second. Each
+broadcast is serialized once, and the same bytes go to every subscriber.
+
+Every subscriber has a one-slot mailbox. A client that has not taken the
+previous update by the time the next one is ready just has it replaced,
+so a slow reader costs one pending payload and never holds up the others.
+"""
+import asyncio
+import json
+import threading
+from typing import AsyncIterator, Callable, Optional, Set
+
+KEEPALIVE_SECONDS = 15
+
+
+class Broadcaster:
+    def __init__(self, snapshot: Callable[[], Optional[dict]], max_rate: float):
+        self.snapshot = snapshot
+        self.interval = 1 / max_rate
+        self.broadcasts = 0
+        self.dropped = 0
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._dirty = False
+        self._dirty_lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last: Optional[bytes] = None
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        for queue in self._subscribers:
+            self._offer(queue, None)
+
+    def notify(self):
+        if self._loop is None or self._dirty:
+            return
+        with self._dirty_lock:
+            if self._dirty:
+                return
+            self._dirty = True
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _encode(self) -> Optional[bytes]:
+        state = self.snapshot()
+        if state is None:
+            return None
+        return f"data: {json.dumps(state, ensure_ascii=False, separators=(',', ':'))}\n\n".encode("utf-8")
+
+    def _offer(self, queue: asyncio.Queue, payload: Optional[bytes]):
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(payload)
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            with self._dirty_lock:
+                self._dirty = False
+            payload = self._encode()
+            if payload is not None and payload != self._last:
+                self._last = payload
+                self.broadcasts += 1
+                for queue in self._subscribers:
+                    self._offer(queue, payload)
+            await asyncio.sleep(self.interval)
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers.add(queue)
+        try:
+            if self._last is None:
+                self._last = self._encode()
+            if self._last is not None:
+                yield self._last
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if payload is None:
+                    return
+                yield payload
+        finally:
+            self._subscribers.discard(queue)
@@ -1,23 +1,44 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, List
+from typing import Dict, List, Optional
 import os
 import json
+import logging
+import secrets
+import threading
+import time
 import uuid
 
-app = FastAPI()
+from counters import ShardedCounter
+from journal import Journal, remove_segments
+from live import Broadcaster
+from voters import VoterSet, load_voters, save_voters, voter_hash
 
-origins = ["http://localhost:3000"]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+POLL_FILE = os.getenv("POLL_FILE", "polls.json")
+DATA_DIR = os.path.dirname(POLL_FILE) or "."
+os.makedirs(DATA_DIR, exist_ok=True)
+
+# Votes and new polls go to an append-only journal; polls.json is a
+# snapshot rewritten every SNAPSHOT_INTERVAL seconds, or once
+# SNAPSHOT_RECORDS journal records have piled up.
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "30"))
+SNAPSHOT_RECORDS = int(os.getenv("SNAPSHOT_RECORDS", "100000"))
 
-POLL_FILE = "polls.json"
+# Live results are pushed over SSE at most LIVE_MAX_RATE times per second.
+LIVE_MAX_RATE = float(os.getenv("LIVE_MAX_RATE", "5"))
+
+# Polls created with one_vote_per_client remember voters by a hash of the
+# X-Voter-Token header or the voter_id cookie (issued on first vote). See
+# voters.py; the sets are saved to VOTER_FILE with every snapshot.
+VOTER_FILE = os.path.join(DATA_DIR, "voters.bin")
+VOTER_COOKIE = "voter_id"
+VOTER_EXACT_LIMIT = int(os.getenv("VOTER_EXACT_LIMIT", "10000"))
+VOTER_FP_RATE = float(os.getenv("VOTER_FP_RATE", "0.001"))
+
+logger = logging.getLogger(__name__)
 
 class PollOption(BaseModel):
     label: str
@@ -27,48 +48,199 @@ class Poll(BaseModel):
     id: str
     question: str
     options: Dict[str, PollOption]
+    one_vote_per_client: bool = False
 
 class CreatePollRequest(BaseModel):
     question: str
     options: List[str]
+    one_vote_per_client: bool = False
+
+def new_poll(poll_id: str, question: str, options: List[str], one_vote_per_client: bool) -> Poll:
+    return Poll(
+        id=poll_id,
+        question=question,
+        options={opt: PollOption(label=opt) for opt in options},
+        one_vote_per_client=one_vote_per_client,
+    )
+
+def poll_view(poll: Poll) -> Poll:
+    """The poll with its current vote totals filled in."""
+    return Poll.model_construct(
+        id=poll.id,
+        question=poll.question,
+        options={
+            key: PollOption.model_construct(label=option.label, votes=votes.get((poll.id, key)))
+            for key, option in poll.options.items()
+        },
+        one_vote_per_client=poll.one_vote_per_client,
+    )
 
-def load_polls() -> List[Poll]:
+def add_poll(poll: Poll):
+    polls.append(poll)
+    polls_by_id[poll.id] = poll
+    if poll.one_vote_per_client and poll.id not in voter_sets:
+        voter_sets[poll.id] = VoterSet(VOTER_EXACT_LIMIT, VOTER_FP_RATE)
+
+def load_polls():
+    """Loads the snapshot and replays the journal written after it."""
+    global snapshot_gen
+    data = []
     if os.path.exists(POLL_FILE):
         with open(POLL_FILE, "r", encoding="utf-8") as f:
             data = json.load(f)
-            return [Poll(**poll) for poll in data]
-    return []
+    # Older files are a bare list of polls, written before the journal.
+    if isinstance(data, dict):
+        snapshot_gen = data["journal"]
+        data = data["polls"]
+    voter_sets.update(load_voters(VOTER_FILE, VOTER_EXACT_LIMIT, VOTER_FP_RATE))
+    for item in data:
+        poll = Poll(**item)
+        for key, option in poll.options.items():
+            votes.add((poll.id, key), option.votes)
+            option.votes = 0
+        add_poll(poll)
+    for record in journal.recover(snapshot_gen):
+        if record[0] == "c":
+            _, poll_id, question, options, one_vote_per_client = record
+            add_poll(new_poll(poll_id, question, options, one_vote_per_client))
+        else:
+            votes.add((record[1], record[2]))
+            if len(record) > 3:
+                voter_sets[record[1]].add(int(record[3], 16))
 
 def save_polls(polls: List[Poll]):
-    with open(POLL_FILE, "w", encoding="utf-8") as f:
-        json.dump([poll.dict() for poll in polls], f, ensure_ascii=False, indent=2)
+    """Writes a snapshot and drops the journal segments it covers."""
+    global snapshot_gen
+    with polls_lock, votes.freeze():
+        data = [poll_view(poll).dict() for poll in polls]
+        gen = journal.rotate()
+    # Voter sets are copied after the rotation, so they include at least
+    # every voter of the votes this snapshot covers.
+    save_voters(VOTER_FILE, gen, voter_sets)
+    tmp = POLL_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"journal": gen, "polls": data}, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, POLL_FILE)
+    snapshot_gen = gen
+    remove_segments(DATA_DIR, gen)
+
+def latest_state() -> Optional[dict]:
+    return poll_view(polls[-1]).dict() if polls else None
+
+def snapshot_loop():
+    while not snapshot_stop.wait(SNAPSHOT_INTERVAL / 10):
+        due = time.monotonic() - snapshot_stats["last"] >= SNAPSHOT_INTERVAL
+        if journal.records >= SNAPSHOT_RECORDS or (due and journal.records):
+            try:
+                save_polls(polls)
+            except Exception:
+                logger.exception("Poll snapshot failed")
+            snapshot_stats["last"] = time.monotonic()
 
-polls: List[Poll] = load_polls()
+journal = Journal(DATA_DIR)
+# Polls hold only the question and option labels; totals live in `votes`,
+# keyed by (poll id, option key). A change is applied and its journal
+# record queued under the same lock (polls_lock for new polls, the
+# thread's vote shard for votes). Snapshots take all of them while copying
+# state and rotating the journal, so every change lands in exactly one of
+# the two.
+polls: List[Poll] = []
+polls_by_id: Dict[str, Poll] = {}
+polls_lock = threading.Lock()
+votes = ShardedCounter()
+voter_sets: Dict[str, VoterSet] = {}
+snapshot_gen = 0
+snapshot_stop = threading.Event()
+snapshot_stats = {"last": 0.0}
+live = Broadcaster(latest_state, LIVE_MAX_RATE)
+
+load_polls()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    journal.start()
+    live.start()
+    snapshot_stats["last"] = time.monotonic()
+    snapshotter = threading.Thread(target=snapshot_loop, name="poll-snapshot", daemon=True)
+    snapshotter.start()
+    yield
+    await live.close()
+    snapshot_stop.set()
+    snapshotter.join()
+    save_polls(polls)
+    journal.close()
+
+app = FastAPI(lifespan=lifespan)
+
+origins = ["http://localhost:3000"]
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
 @app.get("/api/poll/latest", response_model=Poll)
 def get_latest_poll():
     if not polls:
         raise HTTPException(status_code=404, detail="Опросов нет")
-    return polls[-1]
+    return poll_view(polls[-1])
+
+@app.get("/api/poll/latest/stream")
+async def stream_latest_poll():
+    # One event with the current state, then one per change, coalesced.
+    return StreamingResponse(
+        live.subscribe(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/api/poll/create", response_model=Poll)
 def create_poll(payload: CreatePollRequest):
     if len(payload.options) < 2:
         raise HTTPException(status_code=400, detail="Минимум 2 варианта")
     poll_id = str(uuid.uuid4())
-    options_dict = {opt: PollOption(label=opt) for opt in payload.options}
-    poll = Poll(id=poll_id, question=payload.question, options=options_dict)
-    polls.append(poll)
-    save_polls(polls)
+    poll = new_poll(poll_id, payload.question, payload.options, payload.one_vote_per_client)
+    with polls_lock:
+        add_poll(poll)
+        ticket = journal.append(["c", poll_id, payload.question, list(poll.options), poll.one_vote_per_client])
+    journal.wait(ticket)
+    live.notify()
     return poll
 
 @app.post("/api/poll/vote/{poll_id}/{option_key}", response_model=Poll)
-def vote_poll(poll_id: str, option_key: str):
-    for poll in polls:
-        if poll.id == poll_id:
-            if option_key not in poll.options:
-                raise HTTPException(status_code=404, detail="Опция не найдена")
-            poll.options[option_key].votes += 1
-            save_polls(polls)
-            return poll
-    raise HTTPException(status_code=404, detail="Опрос не найден")
+def vote_poll(poll_id: str, option_key: str, request: Request, response: Response):
+    poll = polls_by_id.get(poll_id)
+    if poll is None:
+        raise HTTPException(status_code=404, detail="Опрос не найден")
+    if option_key not in poll.options:
+        raise HTTPException(status_code=404, detail="Опция не найдена")
+    record = ["v", poll_id, option_key]
+    if poll.one_vote_per_client:
+        identity = request.headers.get("x-voter-token") or request.cookies.get(VOTER_COOKIE)
+        if identity is None:
+            identity = secrets.token_urlsafe(16)
+            response.set_cookie(VOTER_COOKIE, identity, max_age=365 * 24 * 3600, httponly=True, samesite="lax")
+        voter = voter_hash(identity)
+        if not voter_sets[poll_id].add(voter):
+            raise HTTPException(status_code=409, detail="Вы уже голосовали в этом опросе")
+        record.append(format(voter, "x"))
+    key = (poll_id, option_key)
+    with votes.hold() as counts:
+        counts[key] = counts.get(key, 0) + 1
+        ticket = journal.append(record)
+    # Waits outside the lock, so concurrent votes share one fsync.
+    try:
+        journal.wait(ticket)
+    except Exception:
+        # Not durable, so not counted: the client may retry.
+        with votes.hold() as counts:
+            counts[key] -= 1
+        if poll.one_vote_per_client:
+            voter_sets[poll_id].discard(voter)
+        raise
+    live.notify()
+    return poll_view(poll)
@@ -0,0 +1,59 @@
+"""Concurrent vote stress check.
+
+Run with `python stress.py [votes]` (default 100,000). It creates a poll in
+a scratch POLL_FILE, fires all votes concurrently through the app
+in-process (sync handlers run on FastAPI's threadpool, as in production),
+then checks the exact totals in the API response and in the snapshot
+written at shutdown.
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+VOTES = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+IN_FLIGHT = 1000
+OPTIONS = ["a", "b", "c", "d"]
+
+os.environ["POLL_FILE"] = os.path.join(tempfile.mkdtemp(), "polls.json")
+
+
+async def main():
+    import main as polls_app
+    async with polls_app.app.router.lifespan_context(polls_app.app):
+        transport = httpx.ASGITransport(app=polls_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            response = await client.post("/api/poll/create", json={"question": "stress", "options": OPTIONS})
+            poll_id = response.json()["id"]
+            semaphore = asyncio.Semaphore(IN_FLIGHT)
+
+            async def vote(i: int):
+                async with semaphore:
+                    response = await client.post(f"/api/poll/vote/{poll_id}/{OPTIONS[i % len(OPTIONS)]}")
+                    response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(vote(i) for i in range(VOTES)))
+            elapsed = time.perf_counter() - started
+            print(f"{VOTES} votes in {elapsed:.1f}s ({VOTES / elapsed:.0f}/s), "
+                  f"{polls_app.journal.commits} journal commits")
+            latest = (await client.get("/api/poll/latest")).json()
+
+    expected = {key: VOTES // len(OPTIONS) + (i < VOTES % len(OPTIONS)) for i, key in enumerate(OPTIONS)}
+    served = {key: option["votes"] for key, option in latest["options"].items()}
+    with open(os.environ["POLL_FILE"], encoding="utf-8") as f:
+        snapshot = json.load(f)["polls"][-1]
+    saved = {key: option["votes"] for key, option in snapshot["options"].items()}
+    for label, totals in (("served", served), ("snapshot", saved)):
+        status = "ok" if totals == expected else f"MISMATCH, expected {expected}"
+        print(f"{label:>8}: {totals} {status}")
+    if served != expected or saved != expected:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,196 @@
+"""Per-poll record of who already voted, for one-vote-per-client polls.
+
+Voters are 128-bit hashes of the client's cookie or token. A VoterSet keeps
+them exactly until it holds `exact_limit` of them, then folds them into a
+scalable Bloom filter: a chain of filters, each twice the capacity of the
+last with half its false-positive rate. Memory then grows by about
+1.44 * log2(1 / fp_rate) bits per voter (about 2 bytes at 0.1%) instead of
+a Python int per voter, and the combined false-positive rate stays under
+`fp_rate`. A false positive rejects a first-time vote; nothing is ever
+counted twice.
+
+A vote whose journal write fails is taken back with `discard()`. Bits
+cannot be cleared from a filter, so a voter discarded after the fold is
+kept in a small `retracted` set that overrides the filters until the
+voter is added again.
+
+All sets are saved together in `voters.bin`, written just before each
+polls.json snapshot. Re-adding a voter is a no-op, so replaying journal
+records the file already covers is harmless.
+"""
+import hashlib
+import math
+import os
+import struct
+import threading
+from typing import Dict, List, Tuple
+
+MAGIC = b"VOTERS02"
+FILE_HEADER = struct.Struct("<8sQI")
+COUNT = struct.Struct("<I")
+FILTER_HEADER = struct.Struct("<QQIdQ")
+GROWTH = 2
+TIGHTENING = 0.5
+
+
+def voter_hash(identity: str) -> int:
+    return int.from_bytes(hashlib.blake2b(identity.encode("utf-8"), digest_size=16).digest(), "little")
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, fp_rate: float):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.bits = max(64, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count = 0
+        self.data = bytearray((self.bits + 7) // 8)
+
+    # Double hashing: k bit positions from the two 64-bit halves of the hash.
+    def __contains__(self, h: int) -> bool:
+        data, bits = self.data, self.bits
+        h1, h2 = h & 0xFFFFFFFFFFFFFFFF, h >> 64 | 1
+        for i in range(self.hashes):
+            p = (h1 + i * h2) % bits
+            if not data[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def add(self, h: int):
+        data, bits = self.data, self.bits
+        h1, h2 = h & 0xFFFFFFFFFFFFFFFF, h >> 64 | 1
+        for i in range(self.hashes):
+            p = (h1 + i * h2) % bits
+            data[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class VoterSet:
+    def __init__(self, exact_limit: int, fp_rate: float):
+        self.exact_limit = exact_limit
+        self.fp_rate = fp_rate
+        self.exact = set()
+        self.filters: List[BloomFilter] = []
+        self.retracted = set()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.exact) + sum(f.count for f in self.filters) - len(self.retracted)
+
+    def __contains__(self, h: int) -> bool:
+        if h in self.retracted:
+            return False
+        return h in self.exact or any(h in f for f in self.filters)
+
+    def add(self, h: int) -> bool:
+        """Records the voter. Returns False if it was (or looks) already there."""
+        with self.lock:
+            if h in self.retracted:
+                # Its bits are still set.
+                self.retracted.remove(h)
+                return True
+            if h in self:
+                return False
+            if not self.filters and len(self.exact) < self.exact_limit:
+                self.exact.add(h)
+                return True
+            if not self.filters:
+                self._grow()
+                for old in self.exact:
+                    self.filters[-1].add(old)
+                self.exact = set()
+            if self.filters[-1].count >= self.filters[-1].capacity:
+                self._grow()
+            self.filters[-1].add(h)
+            return True
+
+    def discard(self, h: int):
+        """Takes back a voter added by add()."""
+        with self.lock:
+            if h in self.exact:
+                self.exact.remove(h)
+            elif self.filters:
+                self.retracted.add(h)
+
+    def _grow(self):
+        if self.filters:
+            last = self.filters[-1]
+            capacity, fp_rate = last.capacity * GROWTH, last.fp_rate * TIGHTENING
+        else:
+            # The first filter gets half the budget; the tightening series
+            # keeps the sum of all stages under fp_rate.
+            capacity, fp_rate = self.exact_limit * GROWTH, self.fp_rate * (1 - TIGHTENING)
+        self.filters.append(BloomFilter(capacity, fp_rate))
+
+    def to_bytes(self) -> bytes:
+        with self.lock:
+            parts = [COUNT.pack(len(self.exact))]
+            parts.append(b"".join(h.to_bytes(16, "little") for h in self.exact))
+            parts.append(COUNT.pack(len(self.filters)))
+            for f in self.filters:
+                parts.append(FILTER_HEADER.pack(f.capacity, f.bits, f.hashes, f.fp_rate, f.count))
+                parts.append(bytes(f.data))
+            parts.append(COUNT.pack(len(self.retracted)))
+            parts.append(b"".join(h.to_bytes(16, "little") for h in self.retracted))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: memoryview, exact_limit: int, fp_rate: float) -> Tuple["VoterSet", int]:
+        """Returns the set and the number of bytes it used."""
+        voters = cls(exact_limit, fp_rate)
+        (exact_count,) = COUNT.unpack_from(data, 0)
+        offset = COUNT.size
+        for _ in range(exact_count):
+            voters.exact.add(int.from_bytes(data[offset:offset + 16], "little"))
+            offset += 16
+        (filter_count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        for _ in range(filter_count):
+            capacity, bits, hashes, f_rate, count = FILTER_HEADER.unpack_from(data, offset)
+            offset += FILTER_HEADER.size
+            f = BloomFilter.__new__(BloomFilter)
+            f.capacity, f.bits, f.hashes, f.fp_rate, f.count = capacity, bits, hashes, f_rate, count
+            size = (bits + 7) // 8
+            f.data = bytearray(data[offset:offset + size])
+            offset += size
+            voters.filters.append(f)
+        (retracted_count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        for _ in range(retracted_count):
+            voters.retracted.add(int.from_bytes(data[offset:offset + 16], "little"))
+            offset += 16
+        return voters, offset
+
+
+def save_voters(path: str, gen: int, sets: Dict[str, VoterSet]):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(FILE_HEADER.pack(MAGIC, gen, len(sets)))
+        for poll_id, voters in sets.items():
+            raw_id = poll_id.encode("utf-8")
+            f.write(struct.pack("<H", len(raw_id)) + raw_id)
+            f.write(voters.to_bytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_voters(path: str, exact_limit: int, fp_rate: float) -> Dict[str, VoterSet]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb") as f:
+        data = memoryview(f.read())
+    magic, _, count = FILE_HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a voter file")
+    offset = FILE_HEADER.size
+    sets = {}
+    for _ in range(count):
+        (id_len,) = struct.unpack_from("<H", data, offset)
+        offset += 2
+        poll_id = bytes(data[offset:offset + id_len]).decode("utf-8")
+        offset += id_len
+        voters, used = VoterSet.from_bytes(data[offset:], exact_limit, fp_rate)
+        offset += used
+        sets[poll_id] = voters
+    return sets
@@ -9,6 +9,7 @@ const API_URL = 'http://localhost:8000/api';
 export default function CreatePollPage() {
   const [question, setQuestion] = useState('');
   const [options, setOptions] = useState(['', '']);
+  const [oneVotePerClient, setOneVotePerClient] = useState(false);
   const router = useRouter();
 
   const handleOptionChange = (value: string, index: number) => {
@@ -31,6 +32,7 @@ export default function CreatePollPage() {
       await axios.post(`${API_URL}/poll/create`, {
         question,
         options,
+        one_vote_per_client: oneVotePerClient,
       });
       router.push('/');
     } catch (error) {
@@ -83,6 +85,14 @@ export default function CreatePollPage() {
             + Добавить вариант
           </button>
         </div>
+        <label className="flex items-center gap-2">
+          <input
+            type="checkbox"
+            checked={oneVotePerClient}
+            onChange={(e) => setOneVotePerClient(e.target.checked)}
+          />
+          Один голос с устройства
+        </label>
         <button
           type="submit"
           className="w-full bg-green-600 hover:bg-green-700 text-white py-2 rounded font-semibold"
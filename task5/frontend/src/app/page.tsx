@@ -12,6 +12,7 @@ interface PollData {
   id: string;
   question: string;
   options: Record<string, PollOption>;
+  one_vote_per_client: boolean;
 }
 
 const API_URL = 'http://localhost:8000/api';
@@ -20,32 +21,38 @@ export default function Home() {
   const [pollData, setPollData] = useState<PollData | null>(null);
   const [voted, setVoted] = useState<string | null>(null);
 
-  const fetchPollData = async () => {
-    try {
-      const response = await axios.get(`${API_URL}/poll/latest`);
-      const poll = response.data;
-      setPollData(poll);
-      const saved = localStorage.getItem(`poll-vote-${poll.id}`);
-      if (saved) setVoted(saved);
-    } catch (error) {
-      console.error("Ошибка загрузки:", error);
-    }
+  const showPoll = (poll: PollData) => {
+    setPollData(poll);
+    const saved = localStorage.getItem(`poll-vote-${poll.id}`);
+    setVoted(saved);
   };
 
   useEffect(() => {
-    fetchPollData();
-    const interval = setInterval(fetchPollData, 3000);
-    return () => clearInterval(interval);
+    // The server pushes the latest poll on connect and again whenever votes
+    // change; EventSource reconnects by itself if the stream drops.
+    const source = new EventSource(`${API_URL}/poll/latest/stream`);
+    source.onmessage = (event) => showPoll(JSON.parse(event.data));
+    source.onerror = () => console.error("Ошибка загрузки: поток прерван, переподключение...");
+    return () => source.close();
   }, []);
 
   const handleVote = async (optionKey: string) => {
-    if (!pollData || voted) return;
+    if (!pollData || voted !== null) return;
     try {
-      const response = await axios.post(`${API_URL}/poll/vote/${pollData.id}/${optionKey}`);
+      // withCredentials sends the voter_id cookie polls use to allow one vote per client.
+      const response = await axios.post(`${API_URL}/poll/vote/${pollData.id}/${optionKey}`, null, {
+        withCredentials: true,
+      });
       setPollData(response.data);
       setVoted(optionKey);
       localStorage.setItem(`poll-vote-${pollData.id}`, optionKey);
     } catch (error) {
+      if (axios.isAxiosError(error) && error.response?.status === 409) {
+        // Already voted from this device: lock the buttons without marking an option.
+        setVoted('');
+        localStorage.setItem(`poll-vote-${pollData.id}`, '');
+        return;
+      }
       console.error("Ошибка голосования:", error);
     }
   };
@@ -75,10 +82,10 @@ export default function Home() {
                     ></div>
                   </div>
                   <button
-                    disabled={!!voted}
+                    disabled={voted !== null}
                     onClick={() => handleVote(key)}
                     className={`w-full mt-1 py-1 text-white rounded ${
-                      voted ? 'bg-gray-400' : 'bg-green-600 hover:bg-green-700'
+                      voted !== null ? 'bg-gray-400' : 'bg-green-600 hover:bg-green-700'
                     } ${voted === key ? '!bg-blue-700' : ''}`}
                   >
                     {voted === key ? 'Ваш голос' : 'Голосовать'}
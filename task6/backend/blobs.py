@@ -0,0 +1,123 @@
+"""Content-addressed image store with reference counts.
+
+A blob is named after the SHA-256 of its bytes plus the sniffed extension,
+so identical uploads share one file and one URL. Each upload of the same
+bytes adds a reference; the file is removed when the last one is released.
+
+Counts live in a SQLite table, one row per blob, and each change writes
+only its own row. Files in the image directory that the table does not
+know about (older uuid-named uploads, or a crash between rename and save)
+count as one reference each; rows for files that are gone are dropped.
+"""
+import asyncio
+import os
+import re
+import sqlite3
+from typing import Dict, Iterable, Optional, Tuple
+
+# A blob, or a variant of one (see variants.py).
+HASH_NAME = re.compile(r"^([0-9a-f]{64}(?:-\d+w)?)\.[a-z0-9]+$")
+
+
+def content_tag(name: str) -> Optional[str]:
+    """Returns the strong ETag value for a content-addressed file name, if it is one."""
+    match = HASH_NAME.match(name)
+    return match.group(1) if match else None
+
+
+class BlobStore:
+    def __init__(self, directory: str, refs_db: str):
+        self.directory = directory
+        self.refs_db = refs_db
+        self.refs: Dict[str, int] = {}
+        # File name by stem, to find the original of a variant.
+        self.stems: Dict[str, str] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._save_lock = asyncio.Lock()
+
+    def load(self, names: Iterable[str]):
+        """Reconciles the saved counts with `names`, the files now in the directory."""
+        # Used from one worker thread at a time, under the save lock.
+        self._db = sqlite3.connect(self.refs_db, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS refs (name TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+        saved = dict(self._db.execute("SELECT name, count FROM refs"))
+        self.refs = {name: max(1, saved.get(name, 1)) for name in names}
+        self.stems = {os.path.splitext(name)[0]: name for name in self.refs}
+        with self._db:
+            gone = saved.keys() - self.refs.keys()
+            self._db.executemany("DELETE FROM refs WHERE name = ?", ((name,) for name in gone))
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def save(self, name: str):
+        # Writes the count as of taking the lock, so a later save can never
+        # be overwritten by an earlier one.
+        async with self._save_lock:
+            await asyncio.to_thread(self._write_count, name, self.refs.get(name, 0))
+
+    def _write_count(self, name: str, count: int):
+        with self._db:
+            if count:
+                self._db.execute(
+                    "INSERT INTO refs (name, count) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET count = excluded.count",
+                    (name, count),
+                )
+            else:
+                self._db.execute("DELETE FROM refs WHERE name = ?", (name,))
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    async def add(self, tmp_path: str, sha256: str, extension: str) -> Tuple[str, bool]:
+        """Stores the finished upload at `tmp_path` under its hash.
+
+        Returns the blob name and whether it was new. A duplicate's temp
+        file is discarded and the existing blob is left untouched.
+        """
+        name = f"{sha256}{extension}"
+        created = name not in self.refs
+        if not created:
+            self.refs[name] += 1
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, self.path(name))
+            self.refs[name] = 1
+            self.stems[sha256] = name
+        await self.save(name)
+        return name, created
+
+    async def adopt(self, name: str):
+        """Counts a file that appeared in the directory from outside."""
+        if name not in self.refs:
+            self.refs[name] = 1
+            self.stems[os.path.splitext(name)[0]] = name
+            await self.save(name)
+
+    async def forget(self, name: str):
+        """Drops a file that was removed from the directory from outside."""
+        if self.refs.pop(name, None) is not None:
+            self.stems.pop(os.path.splitext(name)[0], None)
+            await self.save(name)
+
+    async def release(self, name: str) -> Optional[int]:
+        """Drops one reference. Returns the references left, or None if unknown."""
+        count = self.refs.get(name)
+        if count is None:
+            return None
+        if count > 1:
+            self.refs[name] = count - 1
+        else:
+            del self.refs[name]
+            self.stems.pop(os.path.splitext(name)[0], None)
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+        await self.save(name)
+        return count - 1
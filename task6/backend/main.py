@@ -1,12 +1,83 @@
+import asyncio
+import logging
 import os
-import uuid
-import aiofiles
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from pydantic import BaseModel
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+from typing import List, Optional, Set
 
-app = FastAPI()
+from blobs import BlobStore, content_tag
+from manifest import ImageEntry, InvalidCursor, Manifest
+from uploads import NotAnImage, UploadError, UploadTooLarge, receive_upload
+from variants import VariantRenderer, parse_variant_name
+
+IMAGE_DIR = "static/images/"
+# Reference counts for the content-addressed files in IMAGE_DIR.
+REFS_FILE = "blobs.db"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+# Resized copies of every image, rendered in VARIANT_WORKERS processes.
+# Formats the installed Pillow cannot write are skipped.
+VARIANT_DIR = "static/variants/"
+VARIANT_WIDTHS = [320, 640, 1280]
+VARIANT_FORMATS = ["avif", "webp"]
+VARIANT_WORKERS = int(os.getenv("VARIANT_WORKERS", str(os.cpu_count() or 1)))
+
+# /api/images pages through an in-memory manifest of IMAGE_DIR. Set
+# IMAGE_WATCH=1 to also pick up files added or removed by other processes.
+IMAGE_WATCH = os.getenv("IMAGE_WATCH", "0") == "1"
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+logger = logging.getLogger(__name__)
+
+os.makedirs(IMAGE_DIR, exist_ok=True)
+manifest = Manifest(IMAGE_DIR)
+manifest.load()
+blobs = BlobStore(IMAGE_DIR, REFS_FILE)
+blobs.load(manifest.entries)
+renderer = VariantRenderer(IMAGE_DIR, VARIANT_DIR, VARIANT_WIDTHS, VARIANT_FORMATS, VARIANT_WORKERS)
+# Background renders started by uploads, kept so they are not collected.
+render_tasks: Set[asyncio.Task] = set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    renderer.start()
+    watcher = asyncio.create_task(watch_images()) if IMAGE_WATCH else None
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    for task in render_tasks:
+        task.cancel()
+    renderer.close()
+    blobs.close()
+
+
+async def watch_images():
+    try:
+        from watchfiles import awatch
+    except ImportError:
+        logger.warning("IMAGE_WATCH needs the watchfiles package; outside changes will not be seen")
+        return
+    async for changes in awatch(IMAGE_DIR, recursive=False):
+        for _, path in changes:
+            name = os.path.basename(path)
+            # Our own uploads and deletes arrive here too; both sides are idempotent.
+            if manifest.add(name) is not None:
+                await blobs.adopt(name)
+            else:
+                await blobs.forget(name)
+                renderer.remove(name)
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,56 +87,153 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-IMAGE_DIR = "static/images/"
-os.makedirs(IMAGE_DIR, exist_ok=True)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+class ImmutableStaticFiles(StaticFiles):
+    """Files named by their content hash never change, so they are cached for good.
 
-MAX_FILE_SIZE = 5 * 1024 * 1024 
+    A missing variant of an existing image is rendered on request.
+    """
 
-@app.post("/api/upload")
-async def upload_image(file: UploadFile = File(...)):
-    if not file.content_type or not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Файл должен быть изображением.")
+    async def get_response(self, path, scope):
+        try:
+            return await super().get_response(path, scope)
+        except StarletteHTTPException as e:
+            if e.status_code != 404 or not await render_missing_variant(path):
+                raise
+        return await super().get_response(path, scope)
 
-    contents = await file.read()
-    if len(contents) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="Файл слишком большой (максимум 5 МБ).")
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        tag = content_tag(os.path.basename(full_path))
+        if tag is not None:
+            response.headers["etag"] = f'"{tag}"'
+            response.headers["cache-control"] = IMMUTABLE_CACHE
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+async def render_missing_variant(path: str) -> bool:
+    directory, name = os.path.split(path)
+    if directory != os.path.basename(os.path.normpath(VARIANT_DIR)):
+        return False
+    parsed = parse_variant_name(name)
+    if parsed is None:
+        return False
+    stem, width, fmt = parsed
+    original = blobs.stems.get(stem)
+    if original is None or not renderer.accepts(width, fmt):
+        return False
+    return await renderer.ensure(original, width, fmt)
 
-    await file.seek(0)
 
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(IMAGE_DIR, unique_filename)
+app.mount("/static", ImmutableStaticFiles(directory="static"), name="static")
 
+MAX_FILE_SIZE = 5 * 1024 * 1024
+# Uploads are streamed here first and renamed into IMAGE_DIR once complete;
+# it must be on the same filesystem and outside /static.
+UPLOAD_TMP_DIR = "tmp/uploads/"
+
+
+class ImageVariant(BaseModel):
+    width: int
+    format: str
+    url: str
+
+
+class ImageInfo(BaseModel):
+    url: str
+    size: int
+    modified: datetime
+    width: Optional[int]
+    height: Optional[int]
+    variants: List[ImageVariant]
+
+
+class ImagePage(BaseModel):
+    images: List[ImageInfo]
+    next_cursor: Optional[str]
+
+
+def image_info(entry: ImageEntry) -> ImageInfo:
+    return ImageInfo.model_construct(
+        url=f"/static/images/{entry.name}",
+        size=entry.size,
+        modified=datetime.fromtimestamp(entry.mtime_ns / 1e9, timezone.utc),
+        width=entry.width,
+        height=entry.height,
+        variants=[
+            ImageVariant.model_construct(width=w, format=fmt, url=f"/static/variants/{name}")
+            for w, fmt, name in renderer.variants(entry.name)
+        ],
+    )
+
+
+@app.post("/api/upload")
+async def upload_image(request: Request):
+    """Принимает multipart-поле `file`, потоково записывая его на диск."""
     try:
-        async with aiofiles.open(file_path, mode='wb') as out_file:
-            await out_file.write(contents)
+        upload = await receive_upload(request, "file", UPLOAD_TMP_DIR, MAX_FILE_SIZE)
+    except UploadTooLarge:
+        raise HTTPException(status_code=400, detail="Файл слишком большой (максимум 5 МБ).")
+    except NotAnImage:
+        raise HTTPException(status_code=400, detail="Файл должен быть изображением.")
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при сохранении файла: {e}")
+
+    # The name comes from the content hash and the sniffed format, not the
+    # client's filename; identical bytes get the URL they already have.
+    try:
+        filename, created = await blobs.add(upload.path, upload.sha256, upload.extension)
     except Exception as e:
+        if os.path.exists(upload.path):
+            os.remove(upload.path)
         raise HTTPException(status_code=500, detail=f"Ошибка при сохранении файла: {e}")
 
-    file_url = f"/static/images/{unique_filename}"
-    return {"url": file_url}
+    if created:
+        task = asyncio.create_task(renderer.render_all(filename))
+        render_tasks.add(task)
+        task.add_done_callback(render_tasks.discard)
+
+    entry = manifest.entries.get(filename) or manifest.add(filename)
+    if entry is None:
+        raise HTTPException(status_code=409, detail="Файл удалён во время загрузки.")
+    await asyncio.to_thread(manifest.fill_dimensions, [entry])
+    info = image_info(entry)
+    return {**info.model_dump(), "sha256": upload.sha256, "created": created}
 
 
-@app.get("/api/images", response_model=List[str])
-async def get_images():
-    """Возвращает список URL всех изображений в папке."""
+@app.get("/api/images", response_model=ImagePage)
+async def get_images(
+    cursor: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """Возвращает страницу изображений, от новых к старым, с URL их уменьшенных копий.
+
+    Следующая страница запрашивается с `cursor` из поля `next_cursor`.
+    """
     try:
-        files = os.listdir(IMAGE_DIR)
-        return [f"/static/images/{f}" for f in files if os.path.isfile(os.path.join(IMAGE_DIR, f))]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка при чтении директории: {e}")
+        entries, next_cursor = manifest.page(cursor, limit)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Некорректный курсор.")
+    if any(entry.width is None for entry in entries):
+        await asyncio.to_thread(manifest.fill_dimensions, entries)
+    return ImagePage.model_construct(images=[image_info(e) for e in entries], next_cursor=next_cursor)
 
 
 @app.delete("/api/images/{filename}")
 async def delete_image(filename: str):
-    """Удаляет изображение по имени файла."""
-    file_path = os.path.join(IMAGE_DIR, filename)
-    if not os.path.exists(file_path):
+    """Снимает одну ссылку на изображение; файл удаляется вместе с последней."""
+    if filename not in blobs.refs:
         raise HTTPException(status_code=404, detail="Файл не найден")
     try:
-        os.remove(file_path)
-        return {"message": "Файл удалён"}
+        remaining = await blobs.release(filename)
+        if remaining:
+            return {"message": "Ссылка удалена", "references": remaining}
+        manifest.remove(filename)
+        renderer.remove(filename)
+        return {"message": "Файл удалён", "references": 0}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка при удалении файла: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Ошибка при удалении файла: {e}")
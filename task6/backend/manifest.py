@@ -0,0 +1,129 @@
+"""In-memory listing of the image directory.
+
+Built once at startup with a single os.scandir pass, then kept current by
+the upload and delete handlers (and, if enabled, a filesystem watcher), so
+listing never touches the directory. Entries are kept sorted by
+(mtime, name); pages walk that order newest first, and the cursor is the
+key of the last entry returned, so a page boundary does not move when
+images are added or removed elsewhere in the listing.
+
+Dimensions are read from the image header the first time an entry is
+listed rather than at startup, which would open every file.
+"""
+import base64
+import bisect
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# EXIF orientations that rotate the image by 90 degrees.
+TRANSPOSED = {5, 6, 7, 8}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class ImageEntry:
+    name: str
+    size: int
+    mtime_ns: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+    @property
+    def key(self) -> Tuple[int, str]:
+        return self.mtime_ns, self.name
+
+
+def read_dimensions(path: str) -> Tuple[Optional[int], Optional[int]]:
+    """Width and height as displayed, from the header only."""
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            if image.getexif().get(0x0112) in TRANSPOSED:
+                width, height = height, width
+            return width, height
+    except Exception:
+        return None, None
+
+
+def encode_cursor(key: Tuple[int, str]) -> str:
+    return base64.urlsafe_b64encode(f"{key[0]}/{key[1]}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        mtime_ns, name = raw.split("/", 1)
+        return int(mtime_ns), name
+    except ValueError as e:
+        raise InvalidCursor(cursor) from e
+
+
+class Manifest:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.entries: Dict[str, ImageEntry] = {}
+        # Sorted ascending; the newest entry is last.
+        self._keys: List[Tuple[int, str]] = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self):
+        entries = {}
+        with os.scandir(self.directory) as it:
+            for e in it:
+                if e.is_file():
+                    st = e.stat()
+                    entries[e.name] = ImageEntry(e.name, st.st_size, st.st_mtime_ns)
+        self.entries = entries
+        self._keys = sorted(entry.key for entry in entries.values())
+
+    def add(self, name: str) -> Optional[ImageEntry]:
+        """Adds or refreshes `name` from disk. Returns None if it is not a file."""
+        path = os.path.join(self.directory, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.remove(name)
+            return None
+        old = self.entries.get(name)
+        if old is not None:
+            if old.key == (st.st_mtime_ns, name) and old.size == st.st_size:
+                return old
+            self.remove(name)
+        entry = ImageEntry(name, st.st_size, st.st_mtime_ns)
+        self.entries[name] = entry
+        # New files are the newest, so this is normally an append.
+        if not self._keys or self._keys[-1] < entry.key:
+            self._keys.append(entry.key)
+        else:
+            bisect.insort(self._keys, entry.key)
+        return entry
+
+    def remove(self, name: str):
+        entry = self.entries.pop(name, None)
+        if entry is None:
+            return
+        i = bisect.bisect_left(self._keys, entry.key)
+        if i < len(self._keys) and self._keys[i] == entry.key:
+            del self._keys[i]
+
+    def page(self, cursor: Optional[str], limit: int) -> Tuple[List[ImageEntry], Optional[str]]:
+        """Up to `limit` entries older than `cursor`, newest first, and the next cursor."""
+        end = len(self._keys) if cursor is None else bisect.bisect_left(self._keys, decode_cursor(cursor))
+        start = max(0, end - limit)
+        page = [self.entries[name] for _, name in reversed(self._keys[start:end])]
+        next_cursor = encode_cursor(self._keys[start]) if start > 0 else None
+        return page, next_cursor
+
+    def fill_dimensions(self, entries: List[ImageEntry]):
+        """Reads missing dimensions; blocking, so run it in a thread."""
+        for entry in entries:
+            if entry.width is None:
+                entry.width, entry.height = read_dimensions(os.path.join(self.directory, entry.name))
@@ -0,0 +1,150 @@
+"""Streaming multipart upload straight to a temp file.
+
+The request body is fed to python-multipart's push parser CHUNK_SIZE bytes
+at a time; the file part goes to disk as it arrives while its size and
+SHA-256 are tracked. The upload is refused as soon as it passes the size
+limit, or as soon as its first bytes do not match a known image format,
+so memory per upload stays around one chunk whatever the file size.
+"""
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import List, Optional
+
+import aiofiles
+from fastapi import Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 12
+# Slack for the multipart framing around the file when checking Content-Length.
+FORM_OVERHEAD = 16 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+class NotAnImage(UploadError):
+    pass
+
+
+@dataclass
+class StreamedUpload:
+    path: str
+    size: int
+    sha256: str
+    extension: str
+
+
+def sniff_image(head: bytes) -> Optional[str]:
+    """Returns the file extension for the image format in `head`, if any."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+async def receive_upload(request: Request, field: str, tmp_dir: str, max_size: int) -> StreamedUpload:
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("Ожидается multipart/form-data.")
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > max_size + FORM_OVERHEAD:
+        raise UploadTooLarge()
+
+    pieces: List[bytes] = []
+    part = {"headers": [], "field": b"", "value": b"", "is_file": False, "done": False}
+
+    def on_part_begin():
+        part["headers"] = []
+        part["is_file"] = False
+
+    def on_header_field(data, start, end):
+        part["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"].append((part["field"].lower(), part["value"]))
+        part["field"] = part["value"] = b""
+
+    def on_headers_finished():
+        for name, value in part["headers"]:
+            if name == b"content-disposition":
+                _, options = parse_options_header(value)
+                part["is_file"] = options.get(b"name") == field.encode() and not part["done"]
+
+    def on_part_data(data, start, end):
+        if part["is_file"]:
+            pieces.append(bytes(data[start:end]))
+
+    def on_part_end():
+        if part["is_file"]:
+            part["done"] = True
+            part["is_file"] = False
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+    os.close(fd)
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    extension = None
+    try:
+        async with aiofiles.open(path, "wb") as out:
+            async for chunk in request.stream():
+                for i in range(0, len(chunk), CHUNK_SIZE):
+                    parser.write(chunk[i:i + CHUNK_SIZE])
+                    if not pieces:
+                        continue
+                    data = b"".join(pieces)
+                    pieces.clear()
+                    size += len(data)
+                    if size > max_size:
+                        raise UploadTooLarge()
+                    if extension is None:
+                        head += data[:SNIFF_BYTES]
+                        if len(head) >= SNIFF_BYTES:
+                            extension = sniff_image(head)
+                            if extension is None:
+                                raise NotAnImage()
+                    digest.update(data)
+                    await out.write(data)
+            parser.finalize()
+        if not part["done"]:
+            raise UploadError("Файл не найден в запросе.")
+        if extension is None:
+            # Shorter than SNIFF_BYTES.
+            extension = sniff_image(head)
+            if extension is None:
+                raise NotAnImage()
+    except MultipartParseError as e:
+        os.remove(path)
+        raise UploadError("Повреждённые данные формы.") from e
+    except BaseException:
+        os.remove(path)
+        raise
+    return StreamedUpload(path=path, size=size, sha256=digest.hexdigest(), extension=extension)
@@ -0,0 +1,142 @@
+"""Resized copies of uploaded images in modern formats.
+
+Each original gets one variant per configured width and format, named
+`<original stem>-<width>w.<format>` in the variant directory. Rendering is
+CPU-bound, so it runs in a pool of worker processes and the event loop only
+awaits the result. Variants are rendered in the background after an upload;
+a request for one that is still missing (rendering in progress, failed
+earlier, or a newly configured width) renders it then and there. Requests
+for a variant that is already being rendered share that work.
+
+Originals are never enlarged: a width above the original's keeps its size
+and only changes the format.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+VARIANT_NAME = re.compile(r"^(.+)-(\d+)w\.([a-z0-9]+)$")
+SAVE_OPTIONS = {
+    "avif": {"quality": 60, "speed": 6},
+    "webp": {"quality": 80, "method": 4},
+}
+
+
+def variant_name(original: str, width: int, fmt: str) -> str:
+    return f"{os.path.splitext(original)[0]}-{width}w.{fmt}"
+
+
+def parse_variant_name(name: str) -> Optional[Tuple[str, int, str]]:
+    """Returns (original stem, width, format) for a variant file name."""
+    match = VARIANT_NAME.match(name)
+    if not match:
+        return None
+    return match.group(1), int(match.group(2)), match.group(3)
+
+
+def supported_formats(formats: Sequence[str]) -> List[str]:
+    """Drops the formats this Pillow build cannot write."""
+    return [fmt for fmt in formats if fmt in SAVE_OPTIONS and features.check(fmt)]
+
+
+def render(src: str, dest: str, width: int, fmt: str):
+    """Runs in a worker process."""
+    with Image.open(src) as image:
+        # Lets the JPEG decoder scale down by a power of two while decoding.
+        image.draft("RGB", (width, width))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if alpha else "RGB")
+        image.thumbnail((width, image.height), Image.LANCZOS)
+        tmp = dest + ".tmp"
+        image.save(tmp, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+    os.replace(tmp, dest)
+
+
+class VariantRenderer:
+    def __init__(self, source_dir: str, variant_dir: str, widths: Sequence[int], formats: Sequence[str], workers: int):
+        self.source_dir = source_dir
+        self.variant_dir = variant_dir
+        self.widths = sorted(widths)
+        self.formats = supported_formats(formats)
+        self.workers = workers
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        os.makedirs(variant_dir, exist_ok=True)
+
+    def start(self):
+        # Workers are spawned rather than forked from the server process.
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def variants(self, original: str) -> List[Tuple[int, str, str]]:
+        """(width, format, file name) of every configured variant of `original`."""
+        return [(w, fmt, variant_name(original, w, fmt)) for fmt in self.formats for w in self.widths]
+
+    def accepts(self, width: int, fmt: str) -> bool:
+        return width in self.widths and fmt in self.formats
+
+    async def ensure(self, original: str, width: int, fmt: str) -> bool:
+        """Renders the variant unless it is on disk. Returns whether it is there now."""
+        name = variant_name(original, width, fmt)
+        dest = os.path.join(self.variant_dir, name)
+        if os.path.exists(dest):
+            return True
+        pending = self._pending.get(name)
+        if pending is None:
+            pending = self._pending[name] = asyncio.ensure_future(self._render(original, dest, width, fmt))
+            pending.add_done_callback(lambda _: self._pending.pop(name, None))
+        return await asyncio.shield(pending)
+
+    async def _render(self, original: str, dest: str, width: int, fmt: str) -> bool:
+        src = os.path.join(self.source_dir, original)
+        pool = self.pool
+        if pool is None:
+            return False
+        try:
+            await asyncio.get_running_loop().run_in_executor(pool, render, src, dest, width, fmt)
+        except BrokenProcessPool:
+            # A worker died (out of memory, a crashing decoder); the pool
+            # refuses all work after that, so the first render to notice
+            # starts a fresh one.
+            logger.exception("Variant worker died rendering %s", dest)
+            if self.pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self.start()
+            return False
+        except Exception:
+            logger.exception("Could not render %s", dest)
+            return False
+        if not os.path.exists(src):
+            # The original was deleted while this was rendering.
+            self._unlink(dest)
+            return False
+        return True
+
+    async def render_all(self, original: str):
+        await asyncio.gather(*(self.ensure(original, w, fmt) for w, fmt, _ in self.variants(original)))
+
+    def remove(self, original: str):
+        for _, _, name in self.variants(original):
+            self._unlink(os.path.join(self.variant_dir, name))
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -2,21 +2,49 @@
 
 import { useState, useEffect, ChangeEvent, FormEvent } from 'react';
 import axios from 'axios';
-import Image from 'next/image';
 
 const API_URL = 'http://localhost:8000';
+const SIZES = '(max-width: 768px) 100vw, (max-width: 1200px) 50vw, 33vw';
+
+type ImageVariant = { width: number; format: string; url: string };
+type ImageInfo = {
+  url: string;
+  size: number;
+  modified: string;
+  width: number | null;
+  height: number | null;
+  variants: ImageVariant[];
+};
+type ImagePage = { images: ImageInfo[]; next_cursor: string | null };
+
+const absolute = (url: string) =>
+  url.startsWith('http://') || url.startsWith('https://')
+    ? url
+    : `${API_URL}${url.startsWith('/') ? '' : '/'}${url}`;
+
+// Variants of one format as an srcset, e.g. ".../x-320w.webp 320w, ...".
+const srcSet = (variants: ImageVariant[], format: string) =>
+  variants
+    .filter((v) => v.format === format)
+    .map((v) => `${absolute(v.url)} ${v.width}w`)
+    .join(', ');
 
 export default function Home() {
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
-  const [images, setImages] = useState<string[]>([]);
+  const [images, setImages] = useState<ImageInfo[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [error, setError] = useState('');
   const [uploading, setUploading] = useState(false);
   const [uploadProgress, setUploadProgress] = useState<number>(0);
 
-  const fetchImages = async () => {
+  // Without a cursor, reloads the first (newest) page; with one, appends the next page.
+  const fetchImages = async (cursor: string | null = null) => {
     try {
-      const response = await axios.get(`${API_URL}/api/images`);
-      setImages(response.data);
+      const response = await axios.get<ImagePage>(`${API_URL}/api/images`, {
+        params: cursor ? { cursor } : {},
+      });
+      setImages((prev) => (cursor ? [...prev, ...response.data.images] : response.data.images));
+      setNextCursor(response.data.next_cursor);
     } catch (err) {
       console.error('Failed to fetch images:', err);
       setError('Не удалось загрузить галерею.');
@@ -111,22 +139,27 @@ export default function Home() {
       </form>
 
       <div className="grid grid-cols-1 sm:grid-cols-2 md:grid-cols-3 lg:grid-cols-4 gap-6">
-        {images.map((imgUrl, index) => {
-          const filename = imgUrl.split('/').pop() || '';
+        {images.map((image, index) => {
+          const filename = image.url.split('/').pop() || '';
+          const formats = Array.from(new Set(image.variants.map((v) => v.format)));
           return (
-            <div key={index} className="relative aspect-square rounded-lg overflow-hidden shadow-md group">
-              <Image
-                src={
-                  imgUrl.startsWith('http://') || imgUrl.startsWith('https://')
-                    ? imgUrl
-                    : `${API_URL}${imgUrl.startsWith('/') ? '' : '/'}${imgUrl}`
-                }
-                alt={`Uploaded image ${index + 1}`}
-                fill
-                className="object-cover"
-                sizes="(max-width: 768px) 100vw, (max-width: 1200px) 50vw, 33vw"
-                priority={index < 4}
-              />
+            <div key={image.url} className="relative aspect-square rounded-lg overflow-hidden shadow-md group">
+              {/* The backend serves pre-sized variants, so the browser picks one directly. */}
+              <picture>
+                {formats.map((format) => (
+                  <source key={format} type={`image/${format}`} srcSet={srcSet(image.variants, format)} sizes={SIZES} />
+                ))}
+                {/* eslint-disable-next-line @next/next/no-img-element */}
+                <img
+                  src={absolute(image.url)}
+                  width={image.width ?? undefined}
+                  height={image.height ?? undefined}
+                  alt={`Uploaded image ${index + 1}`}
+                  className="absolute inset-0 w-full h-full object-cover"
+                  loading={index < 4 ? 'eager' : 'lazy'}
+                  decoding="async"
+                />
+              </picture>
               <button
                 onClick={() => handleDelete(filename)}
                 className="absolute top-2 right-2 bg-red-600 text-white rounded-full p-2 opacity-80 hover:opacity-100 transition"
@@ -137,6 +170,17 @@ export default function Home() {
           );
         })}
       </div>
+
+      {nextCursor && (
+        <div className="text-center mt-8">
+          <button
+            onClick={() => fetchImages(nextCursor)}
+            className="bg-gray-200 hover:bg-gray-300 text-gray-800 font-bold py-2 px-4 rounded"
+          >
+            Показать ещё
+          </button>
+        </div>
+      )}
     </main>
   );
 }
\ No newline at end of file
@@ -0,0 +1,46 @@
+"""Write throughput of the guestbook writer at different batch limits.
+
+Run with `python benchmark.py [writes]` (default 5,000). For each
+WRITE_BATCH value it opens a fresh store, submits all creates at once
+through the writer queue and reports writes per second and the average
+batch actually committed. A limit of 1 is one fsync per write.
+"""
+import asyncio
+import sys
+import tempfile
+import time
+import uuid
+
+from store import GuestbookStore
+from writer import WriteQueue
+
+WRITES = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+BATCH_SIZES = [1, 4, 16, 64, 256, 1024]
+
+
+async def run(max_batch: int):
+    store = GuestbookStore(tempfile.mkdtemp())
+    store.open()
+    writes = WriteQueue(store, max_batch)
+    writes.start()
+    entries = [
+        {"id": str(uuid.uuid4()), "name": "bench", "message": f"message {i}", "timestamp": "2024-01-01T00:00:00+00:00"}
+        for i in range(WRITES)
+    ]
+    started = time.perf_counter()
+    await asyncio.gather(*(writes.submit("create", e) for e in entries))
+    elapsed = time.perf_counter() - started
+    await writes.close()
+    assert len(store) == WRITES
+    store.close()
+    print(f"{max_batch:>10} {WRITES / elapsed:>10.0f} {writes.commits:>8} {writes.ops / writes.commits:>10.1f}")
+
+
+async def main():
+    print(f"{'batch':>10} {'writes/s':>10} {'commits':>8} {'avg batch':>10}")
+    for max_batch in BATCH_SIZES:
+        await run(max_batch)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,14 +1,34 @@
-import json
+import asyncio
 import uuid
 import os
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
-import aiofiles
+from typing import Optional
 
-app = FastAPI()
+from store import GuestbookStore
+from writer import WriteQueue
+
+DATA_DIR = os.getenv("GUESTBOOK_DIR", "data")
+# Entries are kept in an append-only log with a persisted index; see
+# store.py. An existing data/guestbook.json is imported on first start.
+store = GuestbookStore(DATA_DIR)
+# Every create, update and delete goes through this one writer, which
+# commits up to WRITE_BATCH queued mutations per fsync.
+WRITE_BATCH = int(os.getenv("WRITE_BATCH", "256"))
+writes = WriteQueue(store, WRITE_BATCH)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(store.open)
+    writes.start()
+    yield
+    await writes.close()
+    await asyncio.to_thread(store.close)
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["http://localhost:3000"]
 app.add_middleware(
@@ -19,8 +39,7 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-DB_FILE = "data/guestbook.json"
-os.makedirs("data", exist_ok=True)
+os.makedirs(DATA_DIR, exist_ok=True)
 
 class GuestbookEntry(BaseModel):
     id: str
@@ -35,71 +54,44 @@ class EntryCreate(BaseModel):
 class EntryUpdate(BaseModel):
     message: Optional[str] = None
 
-async def read_db() -> List[GuestbookEntry]:
-    if not os.path.exists(DB_FILE):
-        async with aiofiles.open(DB_FILE, mode='w', encoding='utf-8') as f:
-            await f.write('[]')
-        return []
-
-    async with aiofiles.open(DB_FILE, mode='r', encoding='utf-8') as f:
-        content = await f.read()
-        if not content.strip():
-            return []
-        try:
-            data = json.loads(content)
-            return [GuestbookEntry(**e) for e in data]
-        except Exception:
-            raise HTTPException(status_code=500, detail="Ошибка чтения базы guestbook.json")
-
-async def write_db(entries: List[GuestbookEntry]):
-    async with aiofiles.open(DB_FILE, mode='w', encoding='utf-8') as f:
-        export_data = []
-        for e in entries:
-            d = e.dict()
-            if isinstance(d["timestamp"], datetime):
-                d["timestamp"] = d["timestamp"].isoformat()
-            export_data.append(d)
-        await f.write(json.dumps(export_data, indent=4, ensure_ascii=False))
+def to_record(entry: GuestbookEntry) -> dict:
+    d = entry.dict()
+    d["timestamp"] = d["timestamp"].isoformat()
+    return d
 
 @app.get("/api/entries")
 async def get_entries(page: int = Query(1, ge=1), limit: int = Query(5, ge=1)):
-    entries = await read_db()
-    start = (page - 1) * limit
-    end = start + limit
-    return entries[start:end]
+    records = await asyncio.to_thread(store.page, (page - 1) * limit, limit)
+    return [GuestbookEntry(**r) for r in records]
 
 @app.post("/api/entries", response_model=GuestbookEntry)
 async def create_entry(data: EntryCreate):
     if not data.name.strip() or not data.message.strip():
         raise HTTPException(status_code=400, detail="Имя и сообщение не могут быть пустыми.")
-    
-    entries = await read_db()
+
     new_entry = GuestbookEntry(
         id=str(uuid.uuid4()),
         name=data.name.strip(),
         message=data.message.strip(),
         timestamp=datetime.now(timezone.utc)
     )
-    entries.append(new_entry)
-    await write_db(entries)
+    await writes.submit("create", to_record(new_entry))
     return new_entry
 
 @app.delete("/api/entries/{entry_id}")
 async def delete_entry(entry_id: str):
-    entries = await read_db()
-    filtered = [e for e in entries if e.id != entry_id]
-    if len(filtered) == len(entries):
+    if not await writes.submit("delete", entry_id):
         raise HTTPException(status_code=404, detail="Запись не найдена")
-    await write_db(filtered)
     return {"message": "Удалено"}
 
 @app.put("/api/entries/{entry_id}", response_model=GuestbookEntry)
 async def update_entry(entry_id: str, data: EntryUpdate):
-    entries = await read_db()
-    for entry in entries:
-        if entry.id == entry_id:
-            if data.message is not None:
-                entry.message = data.message.strip()
-            await write_db(entries)
-            return entry
-    raise HTTPException(status_code=404, detail="Запись не найдена")
\ No newline at end of file
+    changes = {}
+    if data.message is not None:
+        changes["message"] = data.message.strip()
+    # The writer reads and rewrites the entry in one step, so edits and
+    # deletes racing on the same entry cannot interleave.
+    record = await writes.submit("update", entry_id, changes)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Запись не найдена")
+    return GuestbookEntry(**record)
\ No newline at end of file
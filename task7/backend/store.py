@@ -0,0 +1,356 @@
+"""Append-only guestbook storage with a persisted index.
+
+Entries live in `guestbook-<gen>.log`, one JSON record per line:
+
+    {"seq": 7, "id": "...", "name": "...", "message": "...", "timestamp": "..."}
+    {"seq": 7, "id": "...", "deleted": true}
+
+Creating or editing an entry appends its full new version; deleting appends
+a tombstone. `seq` fixes an entry's place in the listing and is kept across
+edits. The in-memory index maps each live id to its seq and the offset and
+length of its latest record, so a page costs one pread per entry shown and
+a write costs one append. Writes come in batches from a single writer (see
+writer.py), and each batch shares one fsync.
+
+`guestbook.idx` is a snapshot of that index:
+
+    header   magic, log generation, log size covered, next seq,
+             dead bytes, entry count                             48 bytes
+    entries  seq u64, offset u64, length u32, id length u16, id
+
+It is rewritten in a background thread once the records written after it
+number a quarter of the index (and at least INDEX_MIN_TAIL), and on close.
+Startup loads it and replays only the log written after it, so replay
+stays a fraction of the load, and each write pays O(1) amortized for the
+snapshots. Without a matching index the whole log is replayed.
+
+Superseded records and tombstones are dead bytes. Once there are more of
+them than live bytes (and at least COMPACT_MIN_BYTES), a background thread
+copies the live records into the next generation. Reads and writes carry
+on meanwhile; records appended during the copy are carried over under the
+lock just before the switch.
+"""
+import json
+import logging
+import os
+import struct
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+MAGIC = b"GBIDX001"
+INDEX_HEADER = struct.Struct("<8sQQQQQ")
+INDEX_ENTRY = struct.Struct("<QQIH")
+INDEX_MIN_TAIL = 1000
+INDEX_TAIL_RATIO = 4
+COMPACT_MIN_BYTES = 1024 * 1024
+INDEX_FILE = "guestbook.idx"
+# The JSON file used before this store, imported once if no log exists.
+LEGACY_FILE = "guestbook.json"
+
+logger = logging.getLogger(__name__)
+
+
+def log_path(directory: str, gen: int) -> str:
+    return os.path.join(directory, f"guestbook-{gen:08d}.log")
+
+
+def log_gens(directory: str) -> List[int]:
+    gens = []
+    for name in os.listdir(directory):
+        if name.startswith("guestbook-") and name.endswith(".log"):
+            try:
+                gens.append(int(name[10:-4]))
+            except ValueError:
+                pass
+    return sorted(gens)
+
+
+def encode(record: dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class GuestbookStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.gen = 0
+        self.file = None
+        self.size = 0
+        self.dead = 0
+        self.next_seq = 0
+        # id -> (seq, offset, length) of its latest record.
+        self.index: Dict[str, Tuple[int, int, int]] = {}
+        # Live entries in listing order, as parallel lists.
+        self.seqs: List[int] = []
+        self.ids: List[str] = []
+        self.since_index = 0
+        self.indexing = False
+        self.index_thread: Optional[threading.Thread] = None
+        self.compacting = False
+        # Serializes index snapshot writes; (gen, size) of the last one.
+        self.index_lock = threading.Lock()
+        self.index_written = (0, 0)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- opening ---
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        gens = log_gens(self.directory)
+        if not gens:
+            self._create_from_legacy()
+            gens = [0]
+        self.gen = gens[-1]
+        path = log_path(self.directory, self.gen)
+        for old in gens[:-1]:
+            # Left over from a compaction that finished its switch.
+            os.remove(log_path(self.directory, old))
+        self.file = open(path, "r+b")
+        self.size = os.fstat(self.file.fileno()).st_size
+        start = self._load_index()
+        self._replay(start)
+        order = sorted((seq, id_) for id_, (seq, _, _) in self.index.items())
+        self.seqs = [seq for seq, _ in order]
+        self.ids = [id_ for _, id_ in order]
+
+    def _create_from_legacy(self):
+        records = []
+        legacy = os.path.join(self.directory, LEGACY_FILE)
+        if os.path.exists(legacy):
+            with open(legacy, encoding="utf-8") as f:
+                content = f.read()
+            for seq, entry in enumerate(json.loads(content) if content.strip() else []):
+                records.append(encode({"seq": seq, **entry}))
+        tmp = log_path(self.directory, 0) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, log_path(self.directory, 0))
+
+    def _load_index(self) -> int:
+        """Loads the index snapshot if it matches the log. Returns where replay starts."""
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < INDEX_HEADER.size:
+            return 0
+        magic, gen, covered, next_seq, dead, count = INDEX_HEADER.unpack_from(data, 0)
+        if magic != MAGIC or gen != self.gen or covered > self.size:
+            return 0
+        pos = INDEX_HEADER.size
+        index = {}
+        for _ in range(count):
+            seq, offset, length, id_len = INDEX_ENTRY.unpack_from(data, pos)
+            pos += INDEX_ENTRY.size
+            index[data[pos:pos + id_len].decode("utf-8")] = (seq, offset, length)
+            pos += id_len
+        self.index = index
+        self.next_seq, self.dead = next_seq, dead
+        return covered
+
+    def _replay(self, start: int):
+        self.file.seek(start)
+        offset = start
+        for line in self.file:
+            if not line.endswith(b"\n"):
+                # A write cut short by a crash; nothing acknowledged it.
+                self.file.truncate(offset)
+                self.size = offset
+                break
+            self._apply(json.loads(line), offset, len(line), ordered=False)
+            offset += len(line)
+
+    def _apply(self, record: dict, offset: int, length: int, ordered: bool = True):
+        """Updates the index for a record; the listing order too if `ordered`."""
+        id_ = record["id"]
+        seq = record["seq"]
+        old = self.index.get(id_)
+        if old is not None:
+            self.dead += old[2]
+        if record.get("deleted"):
+            self.dead += length
+            if old is not None:
+                del self.index[id_]
+                if ordered:
+                    i = bisect_left(self.seqs, seq)
+                    del self.seqs[i]
+                    del self.ids[i]
+            return
+        self.index[id_] = (seq, offset, length)
+        self.next_seq = max(self.next_seq, seq + 1)
+        if old is None and ordered:
+            # New entries get the highest seq, so this is an append.
+            self.seqs.append(seq)
+            self.ids.append(id_)
+
+    # --- reading ---
+
+    def _read(self, file, offset: int, length: int) -> dict:
+        record = json.loads(os.pread(file.fileno(), length, offset))
+        del record["seq"]
+        return record
+
+    def get(self, id_: str) -> Optional[dict]:
+        with self.lock:
+            location = self.index.get(id_)
+            file = self.file
+        if location is None:
+            return None
+        return self._read(file, location[1], location[2])
+
+    def page(self, start: int, limit: int) -> List[dict]:
+        """Entries `start` to `start + limit` in listing order."""
+        with self.lock:
+            locations = [self.index[id_] for id_ in self.ids[start:start + limit]]
+            file = self.file
+        # The file object is held, so a compaction switching files meanwhile
+        # does not close it under this read.
+        return [self._read(file, offset, length) for _, offset, length in locations]
+
+    # --- writing ---
+
+    def _append(self, record: dict):
+        data = encode(record)
+        offset = self.size
+        os.pwrite(self.file.fileno(), data, offset)
+        self.size += len(data)
+        self._apply(record, offset, len(data))
+        self.since_index += 1
+
+    def _after_write(self, file):
+        os.fsync(file.fileno())
+        if not self.indexing and self.since_index >= max(INDEX_MIN_TAIL, len(self.index) // INDEX_TAIL_RATIO):
+            self.indexing = True
+            self.index_thread = threading.Thread(target=self._index_in_background, name="guestbook-index", daemon=True)
+            self.index_thread.start()
+        if not self.compacting and self.dead >= COMPACT_MIN_BYTES and self.dead > self.size - self.dead:
+            self.compacting = True
+            threading.Thread(target=self.compact, name="guestbook-compact", daemon=True).start()
+
+    def commit(self, ops: List[tuple]) -> list:
+        """Applies a batch of mutations in order, then makes them durable with one fsync.
+
+        Ops and their results:
+
+            ("create", entry)          -> entry
+            ("update", id, changes)    -> the updated entry, or None if it is gone
+            ("delete", id)             -> whether it existed
+
+        A crash before the fsync may keep any prefix of the batch, none of
+        which was acknowledged.
+        """
+        with self.lock:
+            results = [self._mutate(op) for op in ops]
+            file = self.file
+        self._after_write(file)
+        return results
+
+    def _mutate(self, op: tuple):
+        kind, arg = op[0], op[1]
+        if kind == "create":
+            self._append({"seq": self.next_seq, **arg})
+            return arg
+        location = self.index.get(arg)
+        if location is None:
+            return None if kind == "update" else False
+        if kind == "delete":
+            self._append({"seq": location[0], "id": arg, "deleted": True})
+            return True
+        entry = {**self._read(self.file, location[1], location[2]), **op[2]}
+        self._append({"seq": location[0], **entry})
+        return entry
+
+    # --- index snapshots and compaction ---
+
+    def _index_in_background(self):
+        try:
+            self.save_index()
+        except Exception:
+            # The next write past the threshold tries again.
+            logger.exception("Guestbook index snapshot failed")
+        finally:
+            self.indexing = False
+
+    def save_index(self):
+        with self.lock:
+            covers = (self.gen, self.size)
+            header = INDEX_HEADER.pack(MAGIC, self.gen, self.size, self.next_seq, self.dead, len(self.index))
+            # A flat dict copy is one C-level pass; building the entries
+            # happens after the lock is released.
+            index = self.index.copy()
+            file = self.file
+            self.since_index = 0
+        # Everything the index points at must be on disk before it is.
+        os.fsync(file.fileno())
+        parts = [header]
+        for id_, (seq, offset, length) in index.items():
+            raw = id_.encode("utf-8")
+            parts.append(INDEX_ENTRY.pack(seq, offset, length, len(raw)) + raw)
+        path = os.path.join(self.directory, INDEX_FILE)
+        with self.index_lock:
+            if covers < self.index_written:
+                # A newer snapshot got there first.
+                return
+            with open(path + ".tmp", "wb") as f:
+                f.write(b"".join(parts))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+            self.index_written = covers
+
+    def compact(self):
+        try:
+            self._compact()
+        finally:
+            self.compacting = False
+
+    def _compact(self):
+        with self.lock:
+            old_file, copied_to = self.file, self.size
+            locations = [(id_, self.index[id_]) for id_ in self.ids]
+            gen = self.gen + 1
+        path = log_path(self.directory, gen)
+        index: Dict[str, Tuple[int, int, int]] = {}
+        size = 0
+        with open(path + ".tmp", "w+b") as new:
+            # The bulk of the copy runs without the lock.
+            for id_, (seq, offset, length) in locations:
+                new.write(os.pread(old_file.fileno(), length, offset))
+                index[id_] = (seq, size, length)
+                size += length
+            new.flush()
+            with self.lock:
+                tail = os.pread(old_file.fileno(), self.size - copied_to, copied_to)
+                new.write(tail)
+                new.flush()
+                os.fsync(new.fileno())
+                os.replace(path + ".tmp", path)
+                # Swap in the new log, then replay the tail against it to
+                # bring the copied index up to date.
+                self.file = open(path, "r+b")
+                self.gen, self.size, self.dead = gen, size, 0
+                self.index = index
+                self.seqs = [seq for _, (seq, _, _) in locations]
+                self.ids = [id_ for id_, _ in locations]
+                offset = size
+                for line in tail.splitlines(keepends=True):
+                    self._apply(json.loads(line), offset, len(line))
+                    offset += len(line)
+                self.size = offset
+        self.save_index()
+        os.remove(log_path(self.directory, gen - 1))
+
+    def close(self):
+        if self.file is None:
+            return
+        if self.index_thread is not None:
+            self.index_thread.join()
+        self.save_index()
+        self.file.close()
+        self.file = None
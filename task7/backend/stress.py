@@ -0,0 +1,86 @@
+"""Concurrent write stress check.
+
+Run with `python stress.py [entries]` (default 5,000). Against a scratch
+GUESTBOOK_DIR it fires all creates concurrently through the app
+in-process, then concurrently edits every third entry and deletes every
+fifth, and checks that the listing holds exactly the expected entries,
+both while running and after a restart.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+ENTRIES = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+IN_FLIGHT = 500
+
+os.environ["GUESTBOOK_DIR"] = tempfile.mkdtemp()
+
+
+async def listing(client: httpx.AsyncClient) -> dict:
+    response = await client.get("/api/entries", params={"limit": ENTRIES + 1})
+    return {e["id"]: e["message"] for e in response.json()}
+
+
+async def main():
+    import main as guestbook
+    semaphore = asyncio.Semaphore(IN_FLIGHT)
+
+    async def send(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> dict:
+        async with semaphore:
+            response = await client.request(method, url, **kwargs)
+            response.raise_for_status()
+            return response.json()
+
+    async with guestbook.app.router.lifespan_context(guestbook.app):
+        transport = httpx.ASGITransport(app=guestbook.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            started = time.perf_counter()
+            created = await asyncio.gather(*(
+                send(client, "POST", "/api/entries", json={"name": "stress", "message": f"m{i}"})
+                for i in range(ENTRIES)
+            ))
+            elapsed = time.perf_counter() - started
+            print(f"{ENTRIES} creates in {elapsed:.1f}s ({ENTRIES / elapsed:.0f}/s), "
+                  f"{guestbook.writes.commits} commits")
+
+            ids = [e["id"] for e in created]
+            expected = {e["id"]: e["message"] for e in created}
+            edits = ids[::3]
+            deletes = ids[::5]
+            await asyncio.gather(
+                *(send(client, "PUT", f"/api/entries/{id_}", json={"message": f"edited {id_}"}) for id_ in edits),
+                *(send(client, "DELETE", f"/api/entries/{id_}") for id_ in deletes),
+            )
+            for id_ in edits:
+                expected[id_] = f"edited {id_}"
+            for id_ in deletes:
+                del expected[id_]
+            served = await listing(client)
+        print(f"{guestbook.writes.ops} writes in {guestbook.writes.commits} commits")
+
+    # A fresh store, as after a restart.
+    guestbook.store.__init__(guestbook.DATA_DIR)
+    async with guestbook.app.router.lifespan_context(guestbook.app):
+        transport = httpx.ASGITransport(app=guestbook.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            reopened = await listing(client)
+
+    failed = False
+    for label, entries in (("served", served), ("reopened", reopened)):
+        missing = expected.keys() - entries.keys()
+        extra = entries.keys() - expected.keys()
+        wrong = [id_ for id_ in expected.keys() & entries.keys() if entries[id_] != expected[id_]]
+        ok = not missing and not extra and not wrong
+        failed |= not ok
+        status = "ok" if ok else f"MISMATCH: {len(missing)} missing, {len(extra)} extra, {len(wrong)} wrong"
+        print(f"{label:>8}: {len(entries)} entries {status}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
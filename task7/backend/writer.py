@@ -0,0 +1,72 @@
+"""Single writer task with group commit for guestbook mutations.
+
+Handlers never touch the store's write path themselves. They queue an op
+and await its future. One task takes everything queued (up to
+`max_batch`), commits it with `GuestbookStore.commit` in a worker thread
+(one fsync for the batch) and then resolves every future in the batch.
+While that commit runs, new ops pile up and form the next batch, so under
+load the batch size grows by itself and the cost of each fsync is shared.
+"""
+import asyncio
+from typing import List, Optional, Tuple
+
+from store import GuestbookStore
+
+_STOP = object()
+
+
+class WriteQueue:
+    def __init__(self, store: GuestbookStore, max_batch: int):
+        self.store = store
+        self.max_batch = max_batch
+        self.commits = 0
+        self.ops = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Commits everything already queued, then stops."""
+        if self._task is None:
+            return
+        self._queue.put_nowait(_STOP)
+        await self._task
+        self._task = None
+
+    async def submit(self, *op):
+        """Queues one op (see GuestbookStore.commit) and returns its result once durable."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, future))
+        return await future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch: List[Tuple[tuple, asyncio.Future]] = []
+            item = await self._queue.get()
+            while True:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.max_batch or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            if not batch:
+                continue
+            try:
+                results = await asyncio.to_thread(self.store.commit, [op for op, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.commits += 1
+            self.ops += len(batch)
+            for (_, future), result in zip(batch, results):
+                # The caller may have gone away (client disconnect).
+                if not future.done():
+                    future.set_result(result)